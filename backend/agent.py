@@ -1,41 +1,89 @@
-import nmap
 import requests
+import socket
+import gzip
 import time
 import json
-from ipaddress import ip_address
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from ipaddress import ip_network
+
+from policy import PolicyEngine
+from reporting import DELTA_FORMAT, host_checksum
 
 # Konfigurasi
 SERVER_URL = "http://127.0.0.1:5000/api/agent/report"
-NETWORK_CIDR = "192.168.1.0/24"  # Ganti dengan rentang jaringan Anda
+POLICY_URL = "http://127.0.0.1:5000/api/policies"
+NETWORK_CIDRS = ["192.168.1.0/24"]  # Ganti dengan rentang jaringan Anda (boleh lebih dari satu)
 SCAN_INTERVAL_SECONDS = 60  # Pindai setiap 60 detik
 
-# Aturan Auto-Block
+# Konfigurasi sharding: rentang besar dipecah menjadi sub-blok yang dipindai paralel
+SHARD_PREFIX_V4 = 24  # /16 -> 256 shard /24
+SHARD_PREFIX_V6 = 120
+SCAN_CONCURRENCY = 8  # Jumlah shard yang dipindai bersamaan
+SHARD_TIMEOUT_SECONDS = 120  # Batas waktu per shard
+MAX_SHARDS = 65536  # Batas shard per siklus (IPv4 /8); IPv6 /64 (2^56 shard /120) ditolak
+
+# Konfigurasi pelaporan delta
+AGENT_ID = socket.gethostname()
+REQUEST_TIMEOUT_SECONDS = 30
+CHECKSUM_EVERY_REPORTS = 10  # Kirim checksum lengkap per shard setiap N siklus
+SPOOL_DIR = "agent_spool"  # Antrean laporan yang belum terkirim
+SPOOL_MAX_REPORTS = 1000
+
+# Aturan Auto-Block lokal; digabung dengan aturan dari server (aturan server menang jika prioritas sama)
 BLOCKED_IP_RANGE_START = "192.168.1.5"
 BLOCKED_IP_RANGE_END = "192.168.1.10"
+LOCAL_POLICY_RULES = [
+    {'action': 'block', 'start_ip': BLOCKED_IP_RANGE_START, 'end_ip': BLOCKED_IP_RANGE_END},
+]
+
+policy_engine = PolicyEngine(LOCAL_POLICY_RULES)
+policy_etag = None
+
+class NmapScanner:
+    """Backend pemindai default: ping scan nmap (-sn, ditambah -6 untuk IPv6)."""
+
+    def scan(self, network_cidr, timeout):
+        """Memindai satu rentang dan mengembalikan daftar (ip, hostname) yang aktif."""
+        import nmap  # Diimpor di sini agar backend lain bisa dipakai tanpa python-nmap
+        nm = nmap.PortScanner()
+        arguments = '-sn -6' if ':' in network_cidr else '-sn'
+        nm.scan(hosts=network_cidr, arguments=arguments, timeout=timeout)
+        return [(host, nm[host].hostname()) for host in nm.all_hosts()]
+
+def shard_prefix(network):
+    return SHARD_PREFIX_V4 if network.version == 4 else SHARD_PREFIX_V6
+
+def split_networks(network_cidrs):
+    """Memecah daftar CIDR menjadi shard dengan ukuran SHARD_PREFIX_V4/SHARD_PREFIX_V6.
+
+    Mengembalikan (jumlah_shard, iterator shard); shard dibuat lazily saat iterator dibaca.
+    Melempar ValueError jika totalnya melebihi MAX_SHARDS, sebelum ada shard yang dipindai.
+    """
+    networks = [ip_network(cidr.strip(), strict=False) for cidr in network_cidrs]
+    total = sum(1 << max(0, shard_prefix(network) - network.prefixlen) for network in networks)
+    if total > MAX_SHARDS:
+        raise ValueError(f"{', '.join(map(str, networks))} would need {total} shards "
+                         f"(max {MAX_SHARDS}); use smaller ranges")
+
+    def iter_shards():
+        for network in networks:
+            if network.prefixlen >= shard_prefix(network):
+                yield network
+            else:
+                yield from network.subnets(new_prefix=shard_prefix(network))
+    return total, iter_shards()
 
-def is_ip_in_blocked_range(ip):
-    """Memeriksa apakah IP berada dalam rentang yang diblokir."""
-    start = int(ip_address(BLOCKED_IP_RANGE_START))
-    end = int(ip_address(BLOCKED_IP_RANGE_END))
-    current = int(ip_address(ip))
-    return start <= current <= end
-
-def scan_network(network_cidr):
-    """Memindai jaringan dan mengembalikan daftar perangkat."""
-    nm = nmap.PortScanner()
-    # Pindai host yang aktif di jaringan (-sn: Ping Scan)
-    nm.scan(hosts=network_cidr, arguments='-sn')
-    
+def build_device_list(hosts):
+    """Mengubah hasil pindai (ip, hostname) menjadi payload perangkat untuk server."""
+    # Seluruh batch diklasifikasikan sekaligus oleh mesin kebijakan
+    statuses = policy_engine.classify_statuses([host for host, _ in hosts])
     devices = []
-    for host in nm.all_hosts():
-        status = "Allowed"
-        if is_ip_in_blocked_range(host):
-            status = "Blocked"
-            
+    for (host, hostname), status in zip(hosts, statuses):
         device_info = {
             'ip_address': host,
-            'name': nm[host].hostname() if nm[host].hostname() else f"Device-{host.split('.')[-1]}",
-            'status': status,
+            'name': hostname if hostname else f"Device-{host.split('.')[-1]}",
+            'status': status or "Allowed",
             'location': 'Auto-Discovered',
             'linked_area': 'Internal-LAN'
             # Kita tidak mengirimkan lat/long karena tidak bisa dideteksi otomatis
@@ -43,31 +91,208 @@ def scan_network(network_cidr):
         devices.append(device_info)
     return devices
 
-def report_to_server(devices):
-    """Mengirim data perangkat ke server Flask."""
+def scan_network(network_cidr, scanner=None, timeout=SHARD_TIMEOUT_SECONDS):
+    """Memindai satu rentang jaringan dan mengembalikan daftar perangkat."""
+    scanner = scanner or NmapScanner()
+    return build_device_list(scanner.scan(str(network_cidr), timeout))
+
+def scan_networks(network_cidrs, on_shard, scanner=None, concurrency=SCAN_CONCURRENCY,
+                  timeout=SHARD_TIMEOUT_SECONDS):
+    """Memindai banyak CIDR secara paralel per shard dan mengembalikan statistik pemindaian.
+
+    `on_shard(shard, devices)` dipanggil di thread pemanggil segera setelah setiap shard selesai.
+    """
+    scanner = scanner or NmapScanner()
+    total, shards = split_networks(network_cidrs)
+    stats = {'shards': total, 'addresses': 0, 'hosts_found': 0, 'failed_shards': 0}
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Shard diajukan bertahap (maks. 2x concurrency yang tertunda), bukan semuanya di awal
+        pending = {}
+
+        def submit_next():
+            shard = next(shards, None)
+            if shard is not None:
+                pending[executor.submit(scan_network, shard, scanner, timeout)] = shard
+
+        for _ in range(concurrency * 2):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = pending.pop(future)
+                submit_next()
+                stats['addresses'] += shard.num_addresses
+                try:
+                    devices = future.result()
+                except Exception as e:
+                    stats['failed_shards'] += 1
+                    print(f"Scan of shard {shard} failed: {e}")
+                    continue
+                stats['hosts_found'] += len(devices)
+                on_shard(shard, devices)
+
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
+
+# Satu sesi HTTP (connection pooling) untuk semua laporan
+session = requests.Session()
+
+def refresh_policies():
+    """Memuat ulang aturan dari server jika berubah (ETag); aturan lama tetap dipakai jika gagal."""
+    global policy_engine, policy_etag
+    headers = {'If-None-Match': policy_etag} if policy_etag else {}
     try:
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(SERVER_URL, data=json.dumps(devices), headers=headers)
-        if response.status_code == 200:
-            print(f"Successfully reported {len(devices)} devices to the server.")
-        else:
-            print(f"Error reporting to server: {response.status_code} - {response.text}")
-    except requests.exceptions.ConnectionError as e:
+        response = session.get(POLICY_URL, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+    except requests.exceptions.RequestException:
+        print(f"Could not load policies from {POLICY_URL}; keeping current rules.")
+        return
+    if response.status_code != 200:
+        return
+    rules = response.json().get('policies', [])
+    try:
+        policy_engine = PolicyEngine(LOCAL_POLICY_RULES + rules)
+    except ValueError as e:
+        print(f"Ignoring invalid policies from server: {e}")
+        return
+    policy_etag = response.headers.get('ETag')
+    print(f"Loaded {len(rules)} policies from the server.")
+
+def report_to_server(body):
+    """Mengirim satu laporan (JSON terkompresi gzip) ke server Flask.
+
+    Mengembalikan respons JSON server, atau None jika server tidak bisa dihubungi / error 5xx
+    sehingga laporan perlu disimpan di spool.
+    """
+    headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+    try:
+        response = session.post(SERVER_URL, data=body, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+    except requests.exceptions.ConnectionError:
         print(f"Could not connect to the server at {SERVER_URL}. Is it running?")
-    except Exception as e:
+        return None
+    except requests.exceptions.RequestException as e:
         print(f"An unexpected error occurred: {e}")
+        return None
+
+    if response.status_code >= 500:
+        print(f"Error reporting to server: {response.status_code} - {response.text}")
+        return None
+    if response.status_code != 200:
+        # Laporan ditolak (4xx): mengirim ulang tidak akan membantu
+        print(f"Report rejected by server: {response.status_code} - {response.text}")
+        return {}
+    return response.json()
+
+class DeltaReporter:
+    """Mengirim hanya perubahan per shard dibanding snapshot terakhir yang sudah terkirim/di-spool.
+
+    Laporan yang gagal dikirim disimpan di SPOOL_DIR dan dikirim ulang berurutan sebelum laporan baru.
+    """
+
+    def __init__(self, agent_id=AGENT_ID, spool_dir=SPOOL_DIR, max_spooled=SPOOL_MAX_REPORTS):
+        self.agent_id = agent_id
+        self.spool_dir = spool_dir
+        self.max_spooled = max_spooled
+        self.snapshots = {}  # shard -> {ip: device}
+        self.cycles = {}  # shard -> jumlah laporan, untuk checksum berkala
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def report_shard(self, shard, devices):
+        key = str(shard)
+        current = {device['ip_address']: device for device in devices}
+        previous = self.snapshots.get(key)
+        full = previous is None
+        previous = previous or {}
+
+        upserts = [device for ip, device in current.items() if previous.get(ip) != device]
+        removed = [ip for ip in previous if ip not in current]
+        cycle = self.cycles.get(key, 0) + 1
+        self.cycles[key] = cycle
+        send_checksum = full or cycle % CHECKSUM_EVERY_REPORTS == 0
+        # Shard tanpa perubahan tetap dilaporkan (heartbeat) agar server memperbarui detected_at
+        # dan mencatat satu sampel uptime per host per siklus
+        heartbeat = not upserts and not removed and not send_checksum
+
+        payload = {
+            'format': DELTA_FORMAT,
+            'agent_id': self.agent_id,
+            'shard': key,
+            'full': full,
+            'upserts': upserts,
+            'removed': removed,
+        }
+        if send_checksum:
+            payload['checksum'] = host_checksum(current)
+        if not heartbeat:
+            print(f"Reporting {key}: {len(upserts)} changed, {len(removed)} removed"
+                  f"{' (full)' if full else ''}.")
+
+        # Snapshot maju begitu laporan terkirim atau tersimpan di spool
+        self.snapshots[key] = current
+        self.deliver(gzip.compress(json.dumps(payload).encode()), spool_on_failure=not heartbeat)
+
+    def deliver(self, body, spool_on_failure=True):
+        # Heartbeat tidak di-spool: jika dikirim ulang nanti, waktunya sudah tidak berarti
+        if not self.replay_spool():
+            if spool_on_failure:
+                self.spool(body)
+            return
+        result = report_to_server(body)
+        if result is None:
+            if spool_on_failure:
+                self.spool(body)
+        else:
+            self.handle_result(result)
+
+    def handle_result(self, result):
+        if result.get('resync'):
+            # Server tidak cocok dengan snapshot kita: kirim ulang shard ini secara penuh
+            print(f"Server requested a resync of {result.get('shard')}.")
+            self.snapshots.pop(result.get('shard'), None)
+
+    def spooled_files(self):
+        return sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.json.gz'))
+
+    def spool(self, body):
+        files = self.spooled_files()
+        if len(files) >= self.max_spooled:
+            # Antrean penuh: buang yang terlama dan kirim ulang semua shard secara penuh nanti
+            for name in files[:len(files) - self.max_spooled + 1]:
+                os.remove(os.path.join(self.spool_dir, name))
+            self.snapshots.clear()
+            print("Report spool is full; oldest reports dropped, next reports will be full.")
+        path = os.path.join(self.spool_dir, f"{time.time_ns():020d}.json.gz")
+        with open(path, 'wb') as f:
+            f.write(body)
+
+    def replay_spool(self):
+        """Mengirim ulang laporan di spool secara berurutan. False jika server masih tidak tersedia."""
+        for name in self.spooled_files():
+            path = os.path.join(self.spool_dir, name)
+            with open(path, 'rb') as f:
+                result = report_to_server(f.read())
+            if result is None:
+                return False
+            os.remove(path)
+            self.handle_result(result)
+        return True
 
 if __name__ == "__main__":
     print("Starting Network Scanner Agent...")
+    reporter = DeltaReporter()
     while True:
-        print(f"Scanning network {NETWORK_CIDR}...")
-        discovered_devices = scan_network(NETWORK_CIDR)
+        refresh_policies()
+        print(f"Scanning networks {', '.join(NETWORK_CIDRS)}...")
+        stats = scan_networks(NETWORK_CIDRS, reporter.report_shard)
         
-        if discovered_devices:
-            print(f"Found {len(discovered_devices)} devices.")
-            report_to_server(discovered_devices)
+        if stats['hosts_found']:
+            print(f"Found {stats['hosts_found']} devices in {stats['shards']} shards "
+                  f"({stats['addresses'] / stats['elapsed']:.0f} hosts/sec).")
         else:
             print("No devices found in this scan.")
+        if stats['failed_shards']:
+            print(f"{stats['failed_shards']} shards failed or timed out.")
             
         print(f"Waiting for {SCAN_INTERVAL_SECONDS} seconds until the next scan...")
         time.sleep(SCAN_INTERVAL_SECONDS)
\ No newline at end of file
@@ -1,20 +1,90 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime
+from collections import deque
+from ipaddress import ip_address, ip_network
+import threading
+import time
 import sqlite3
+import json
+import uuid
+import zlib
 import os
 
+import db
+import importer
+from metrics import Metrics
+from policy import PolicyEngine, parse_rule
+from reporting import DELTA_FORMAT, host_checksum
+
 # Inisialisasi Aplikasi Flask
 app = Flask(__name__)
-CORS(app)
+# ETag perlu diekspos agar dashboard bisa mengirim If-None-Match
+CORS(app, expose_headers=["ETag"])
 
-DB_NAME = "database.db"
+DB_NAME = os.environ.get("DATABASE_PATH", "database.db")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "16"))  # Koneksi idle maksimum yang disimpan
+db_pool = db.ConnectionPool(DB_NAME, DB_POOL_SIZE)
+metrics = Metrics()
 
-# --- Database Setup Function ---
-def setup_database():
-    """Membuat database dan tabel 'devices' jika belum ada."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+# Konfigurasi Server-Sent Events
+SSE_HEARTBEAT_SECONDS = 15  # Komentar keepalive agar proxy tidak memutus koneksi idle
+SSE_CLIENT_BUFFER = 64  # Batas event yang tertahan per klien lambat
+
+# Batas ukuran body: laporan agen setelah dekompresi gzip, dan seluruh request (termasuk upload inventaris)
+MAX_REPORT_BYTES = 64 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_UPLOAD_BYTES", 512 * 1024 * 1024))
+
+# Status untuk host yang dilaporkan hilang oleh agen (laporan delta)
+OFFLINE_STATUS = "Offline"
+
+# Riwayat status: kode kecil per observasi, rollup per jam/hari, dan retensi
+STATUS_CODES = {OFFLINE_STATUS: 0, 'Allowed': 1, 'Blocked': 2, 'Maintenance': 3}
+OTHER_STATUS_CODE = 9
+STATUS_CODE_SQL = "CASE {column} " + " ".join(
+    f"WHEN '{status}' THEN {code}" for status, code in STATUS_CODES.items()) + f" ELSE {OTHER_STATUS_CODE} END"
+ROLLUP_PERIODS = {'hour': 3600, 'day': 86400}
+# Observasi per transaksi rollup: setiap batch memegang kunci tulis, jadi dijaga jauh di bawah
+# busy timeout (~0,2-0,4 detik per batch) dan diberi jeda agar laporan agen yang menunggu bisa masuk
+ROLLUP_BATCH_SIZE = 25000
+ROLLUP_BATCH_PAUSE_SECONDS = 0.05
+ROLLUP_INTERVAL_SECONDS = 300
+# Worker rollup latar belakang per proses; set ROLLUP_WORKER=0 (default di Vercel) dan jalankan
+# `flask --app app rollup` dari cron jika proses tidak hidup terus
+ROLLUP_WORKER = os.environ.get("ROLLUP_WORKER", "0" if os.environ.get("VERCEL") else "1") == "1"
+RETENTION_SECONDS = {
+    'raw': 7 * 86400,  # Observasi mentah
+    'hour': 90 * 86400,
+    'day': 2 * 365 * 86400,
+}
+
+# Impor inventaris Excel/CSV
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "uploads")
+IMPORT_CHUNK_ROWS = 5000  # Baris per transaksi upsert
+MAX_IMPORT_ERRORS = 10000  # Batas error per job yang disimpan (jumlah total tetap dihitung)
+
+# Konfigurasi pencarian & paginasi
+MAX_PAGE_SIZE = 1000
+
+def ip_to_int(ip):
+    """Mengubah alamat IPv4 menjadi integer untuk range scan; None untuk IPv6/tidak valid."""
+    try:
+        address = ip_address(ip)
+    except ValueError:
+        return None
+    return int(address) if address.version == 4 else None
+
+def format_detected_at(epoch):
+    """Memformat epoch laporan menjadi kolom detected_at (waktu lokal, tanpa zona)."""
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
+
+# --- Database Setup & Migrations ---
+def create_schema(cursor):
+    """Migrasi 1: tabel 'devices' beserta indeks, FTS, sync_state, kebijakan, riwayat dan job impor.
+
+    Semua pernyataan idempoten sehingga database lama (user_version 0) ikut termigrasi dengan aman.
+    """
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS devices (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -28,21 +98,1024 @@ def setup_database():
             linked_area TEXT
         )
     """)
-    conn.commit()
-    conn.close()
+
+    # Database lama belum punya kolom updated_seq
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(devices)")]
+    if 'updated_seq' not in columns:
+        cursor.execute("ALTER TABLE devices ADD COLUMN updated_seq INTEGER NOT NULL DEFAULT 0")
+    if 'ip_int' not in columns:
+        cursor.execute("ALTER TABLE devices ADD COLUMN ip_int INTEGER")
+        rows = cursor.execute("SELECT id, ip_address FROM devices").fetchall()
+        cursor.executemany("UPDATE devices SET ip_int = ? WHERE id = ?",
+                           [(ip_to_int(ip), device_id) for device_id, ip in rows])
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_updated_seq ON devices(updated_seq)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_ip_int ON devices(ip_int)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_status ON devices(status, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_linked_area ON devices(linked_area, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_detected_at ON devices(detected_at)")
+
+    # Indeks full-text (FTS5, external content) yang disinkronkan lewat trigger.
+    # Trigger update hanya untuk kolom yang diindeks, jadi laporan agen (status/detected_at) tidak memicunya.
+    fts_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'devices_fts'").fetchone()
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS devices_fts USING fts5(
+            name, ip_address, location, linked_area,
+            content='devices', content_rowid='id'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS devices_fts_insert AFTER INSERT ON devices
+        BEGIN
+            INSERT INTO devices_fts (rowid, name, ip_address, location, linked_area)
+            VALUES (new.id, new.name, new.ip_address, new.location, new.linked_area);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS devices_fts_delete AFTER DELETE ON devices
+        BEGIN
+            INSERT INTO devices_fts (devices_fts, rowid, name, ip_address, location, linked_area)
+            VALUES ('delete', old.id, old.name, old.ip_address, old.location, old.linked_area);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS devices_fts_update
+        AFTER UPDATE OF name, ip_address, location, linked_area ON devices
+        BEGIN
+            INSERT INTO devices_fts (devices_fts, rowid, name, ip_address, location, linked_area)
+            VALUES ('delete', old.id, old.name, old.ip_address, old.location, old.linked_area);
+            INSERT INTO devices_fts (rowid, name, ip_address, location, linked_area)
+            VALUES (new.id, new.name, new.ip_address, new.location, new.linked_area);
+        END
+    """)
+    if not fts_exists:
+        cursor.execute("INSERT INTO devices_fts (devices_fts) VALUES ('rebuild')")
+
+    # Versi perubahan yang naik monoton, satu baris per "key"
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('devices', 0)")
+
+    # Tombstone untuk baris yang dihapus agar klien delta bisa ikut menghapus
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS device_tombstones (
+            id INTEGER PRIMARY KEY,
+            ip_address TEXT,
+            deleted_seq INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tombstones_deleted_seq ON device_tombstones(deleted_seq)")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS devices_tombstone AFTER DELETE ON devices
+        BEGIN
+            UPDATE sync_state SET value = value + 1 WHERE key = 'devices';
+            INSERT OR REPLACE INTO device_tombstones (id, ip_address, deleted_seq)
+            VALUES (old.id, old.ip_address, (SELECT value FROM sync_state WHERE key = 'devices'));
+        END
+    """)
+
+    # Host yang saat ini terlihat oleh setiap agen per shard, dasar checksum laporan delta
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS agent_hosts (
+            agent_id TEXT NOT NULL,
+            shard TEXT NOT NULL,
+            ip_address TEXT NOT NULL,
+            PRIMARY KEY (agent_id, shard, ip_address)
+        ) WITHOUT ROWID
+    """)
+
+    # Aturan kebijakan IP; setiap perubahan menaikkan versi 'policies' agar mesin dimuat ulang
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ip_policies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action TEXT NOT NULL,
+            cidr TEXT,
+            start_ip TEXT,
+            end_ip TEXT,
+            priority INTEGER,
+            description TEXT
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('policies', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS ip_policies_{event.lower()} AFTER {event} ON ip_policies
+            BEGIN
+                UPDATE sync_state SET value = value + 1 WHERE key = 'policies';
+            END
+        """)
+
+    # Riwayat status append-only: IP integer, epoch detik, kode status kecil
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS device_observations (
+            device_id INTEGER NOT NULL,
+            observed_at INTEGER NOT NULL,
+            ip_int INTEGER,
+            status_code INTEGER NOT NULL
+        )
+    """)
+    # Rollup per perangkat dan untuk seluruh armada; period = 3600 (jam) atau 86400 (hari)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS device_uptime (
+            device_id INTEGER NOT NULL,
+            period INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            up_samples INTEGER NOT NULL,
+            status_changes INTEGER NOT NULL,
+            PRIMARY KEY (device_id, period, bucket)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fleet_uptime (
+            period INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            up_samples INTEGER NOT NULL,
+            status_changes INTEGER NOT NULL,
+            PRIMARY KEY (period, bucket)
+        ) WITHOUT ROWID
+    """)
+    # Status terakhir per perangkat agar flap di batas batch rollup tetap terhitung
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS device_rollup_state (
+            device_id INTEGER PRIMARY KEY,
+            last_status INTEGER NOT NULL,
+            last_observed INTEGER NOT NULL,
+            last_seen INTEGER
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('rollup_watermark', 0)")
+
+    # Job impor Excel/CSV beserta laporan error per baris
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            filename TEXT,
+            status TEXT NOT NULL,
+            rows_total INTEGER,
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            rows_inserted INTEGER NOT NULL DEFAULT 0,
+            rows_updated INTEGER NOT NULL DEFAULT 0,
+            rows_failed INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TEXT,
+            finished_at TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_errors (
+            job_id TEXT NOT NULL,
+            row_number INTEGER NOT NULL,
+            error TEXT NOT NULL,
+            PRIMARY KEY (job_id, row_number)
+        ) WITHOUT ROWID
+    """)
+
+def add_agent_host_presence(cursor):
+    """Migrasi 2: host yang hilang tetap di agent_hosts (present = 0) agar heartbeat mencatat sampel Offline."""
+    cursor.execute("ALTER TABLE agent_hosts ADD COLUMN present INTEGER NOT NULL DEFAULT 1")
+
+def add_reported_status(cursor):
+    """Migrasi 3: devices.reported_status, status dari agen/impor sebelum kebijakan server diterapkan.
+
+    Untuk baris lama yang saat ini cocok dengan aturan kebijakan, status aslinya tidak diketahui (NULL),
+    sehingga saat aturan dihapus perangkat kembali ke 'Allowed'.
+    """
+    cursor.execute("ALTER TABLE devices ADD COLUMN reported_status TEXT")
+    cursor.execute("UPDATE devices SET reported_status = status")
+    engine = load_policy_engine(cursor)
+    if engine.rule_count:
+        cursor.execute("SELECT id, ip_address FROM devices")
+        rows = cursor.fetchall()
+        cursor.executemany("UPDATE devices SET reported_status = NULL WHERE id = ?",
+                           [(device_id,) for (device_id, _), action in
+                            zip(rows, engine.classify([ip for _, ip in rows])) if action])
+
+def add_observation_ids(cursor):
+    """Migrasi 4: device_observations mendapat id AUTOINCREMENT sebagai kunci watermark rollup.
+
+    Tanpa AUTOINCREMENT, rowid dimulai lagi dari 1 setelah pruning mengosongkan tabel sehingga
+    observasi baru berada di bawah watermark, dilewati rollup, lalu ikut terhapus.
+    """
+    cursor.execute("""
+        CREATE TABLE device_observations_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id INTEGER NOT NULL,
+            observed_at INTEGER NOT NULL,
+            ip_int INTEGER,
+            status_code INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO device_observations_new (id, device_id, observed_at, ip_int, status_code)
+        SELECT rowid, device_id, observed_at, ip_int, status_code FROM device_observations
+    """)
+    cursor.execute("DROP TABLE device_observations")
+    cursor.execute("ALTER TABLE device_observations_new RENAME TO device_observations")
+    # id berikutnya harus di atas watermark walaupun tabel sedang kosong
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'device_observations'")
+    cursor.execute("""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'device_observations', MAX(COALESCE((SELECT MAX(id) FROM device_observations), 0),
+                                          (SELECT value FROM sync_state WHERE key = 'rollup_watermark'))
+    """)
+
+# Migrasi dijalankan berurutan; jumlah migrasi yang sudah diterapkan disimpan di PRAGMA user_version
+MIGRATIONS = [create_schema, add_agent_host_presence, add_reported_status, add_observation_ids]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate_database(conn):
+    """Menerapkan migrasi yang belum dijalankan dalam satu transaksi dan mengembalikan jumlahnya."""
+    cursor = conn.cursor()
+    if cursor.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return 0
+    # BEGIN IMMEDIATE: proses lain yang bermigrasi bersamaan menunggu lalu melihat versi yang baru
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for migration in MIGRATIONS[version:]:
+            migration(cursor)
+        cursor.execute(f"PRAGMA user_version = {max(version, SCHEMA_VERSION)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return max(SCHEMA_VERSION - version, 0)
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def init_db():
+    """Memastikan skema database terbaru, sekali per proses.
+
+    Dijalankan saat deploy (`flask --app app init-db`) atau saat server start, bukan saat modul diimpor;
+    setelahnya request hanya memeriksa flag _schema_ready.
+    """
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with db_pool.connection() as conn:
+            applied = migrate_database(conn)
+        _schema_ready = True
+    if applied:
+        print(f"Database SQLite migrated to schema version {SCHEMA_VERSION}.")
     print("Database SQLite and table 'devices' are ready.")
 
-setup_database()
+@app.cli.command('init-db')
+def init_db_command():
+    """Menjalankan migrasi skema database."""
+    init_db()
+
+@app.cli.command('rollup')
+def rollup_command():
+    """Menjalankan rollup riwayat dan retensi sekali (untuk cron atau scheduler)."""
+    init_db()
+    conn = db.connect(DB_NAME)
+    try:
+        processed = run_rollups(conn)
+        pruned = prune_history(conn)
+    finally:
+        conn.close()
+    print(f"Rolled up {processed} observations, pruned {pruned} raw observations.")
+
+def get_db():
+    """Koneksi dari pool untuk request (app context) ini; dikembalikan ke pool saat teardown."""
+    if not _schema_ready:
+        init_db()
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+def begin_write(conn):
+    """Memulai transaksi tulis dengan BEGIN IMMEDIATE dan mencatat lama menunggu kunci tulis.
+
+    Kunci diambil di awal agar transaksi tidak gagal saat naik dari baca ke tulis di tengah jalan.
+    Tidak melakukan apa-apa jika koneksi sudah berada di dalam transaksi.
+    """
+    if conn.in_transaction:
+        return
+    started = time.perf_counter()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+    except sqlite3.OperationalError:
+        metrics.observe_lock_wait(time.perf_counter() - started, timed_out=True)
+        raise
+    metrics.observe_lock_wait(time.perf_counter() - started)
+
+def record_rows_serialized(count):
+    """Menambah jumlah baris yang diserialisasi pada request ini (untuk /api/metrics)."""
+    g.rows_serialized = g.get('rows_serialized', 0) + count
 
 # --- Helper Function ---
 def get_all_devices_from_db():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    cursor = get_db().cursor()
+    cursor.row_factory = sqlite3.Row
     cursor.execute("SELECT * FROM devices ORDER BY id DESC")
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_sync_version(cursor, key='devices'):
+    """Mengembalikan versi perubahan saat ini untuk key tertentu."""
+    cursor.execute("SELECT value FROM sync_state WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def next_sync_version(cursor, key='devices'):
+    """Menaikkan versi perubahan (dipanggil sekali per transaksi tulis) dan mengembalikannya."""
+    cursor.execute("UPDATE sync_state SET value = value + 1 WHERE key = ?", (key,))
+    return get_sync_version(cursor, key)
+
+def get_device_changes_from_db(since):
+    """Mengembalikan perangkat yang berubah dan ID yang dihapus setelah versi `since`."""
+    cursor = get_db().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute("SELECT * FROM devices WHERE updated_seq > ? ORDER BY id DESC", (since,))
+    devices = [dict(row) for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM device_tombstones WHERE deleted_seq > ? ORDER BY deleted_seq", (since,))
+    deleted = [row[0] for row in cursor.fetchall()]
+    return devices, deleted
+
+def row_cursor(cursor):
+    """Cursor baru pada koneksi yang sama dengan row_factory sqlite3.Row (cursor pemanggil tidak diubah)."""
+    rows = cursor.connection.cursor()
+    rows.row_factory = sqlite3.Row
+    return rows
+
+def get_policies_from_db(cursor):
+    cursor = row_cursor(cursor)
+    cursor.execute("SELECT id, action, cidr, start_ip, end_ip, priority, description FROM ip_policies ORDER BY id")
+    return [dict(row) for row in cursor.fetchall()]
+
+def load_policy_engine(cursor):
+    """Mengompilasi aturan di database menjadi PolicyEngine (tanpa cache)."""
+    return PolicyEngine(get_policies_from_db(cursor))
+
+_policy_cache = {'version': None, 'engine': PolicyEngine()}
+_policy_lock = threading.Lock()
+
+def get_policy_engine(cursor):
+    """Mengembalikan PolicyEngine yang di-cache; dikompilasi ulang hanya jika versi 'policies' berubah."""
+    version = get_sync_version(cursor, 'policies')
+    with _policy_lock:
+        if _policy_cache['version'] != version:
+            _policy_cache['engine'] = load_policy_engine(cursor)
+            _policy_cache['version'] = version
+        return _policy_cache['engine']
+
+def apply_policies_to_devices(cursor, engine, seq):
+    """Menerapkan ulang kebijakan ke seluruh perangkat (kecuali Offline) dan mengembalikan jumlah yang berubah.
+
+    Perangkat yang tidak lagi cocok dengan aturan mana pun kembali ke status yang dilaporkan
+    agen/impor (reported_status), atau 'Allowed' jika tidak diketahui.
+    """
+    cursor.execute("SELECT id, ip_address, status, reported_status FROM devices WHERE status IS NOT ?",
+                   (OFFLINE_STATUS,))
+    rows = cursor.fetchall()
+    statuses = engine.classify_statuses([row[1] for row in rows])
+    updates = []
+    for (device_id, _, current, reported), status in zip(rows, statuses):
+        target = status or reported or 'Allowed'
+        if target != current:
+            updates.append((target, seq, device_id))
+    cursor.executemany("UPDATE devices SET status = ?, updated_seq = ? WHERE id = ?", updates)
+    return len(updates)
+
+def build_fts_query(keyword):
+    """Mengubah kata kunci bebas menjadi query FTS5: setiap kata dicari sebagai prefix (AND)."""
+    terms = ['"' + term.replace('"', '""') + '"*' for term in keyword.split()]
+    return " ".join(terms)
+
+def search_devices_from_db(q=None, status=None, area=None, detected_after=None, limit=None, after=None):
+    """Mencari perangkat dengan filter dan paginasi keyset; mengembalikan (devices, next_cursor).
+
+    q berupa CIDR/IP IPv4 memakai range scan pada ip_int (urut per IP), teks bebas memakai FTS5;
+    next_cursor dikirim kembali sebagai `after` dan bernilai None di halaman terakhir.
+    """
+    source, order_column, descending = "devices", "id", True
+    clauses, params = [], []
+    if q:
+        try:
+            network = ip_network(q.strip(), strict=False)
+        except ValueError:
+            network = None
+        if network is not None and network.version == 4:
+            # Hasil CIDR diurutkan per IP agar range scan pada idx_devices_ip_int bisa berhenti di LIMIT
+            order_column, descending = "ip_int", False
+            clauses.append("ip_int BETWEEN ? AND ?")
+            params += [int(network.network_address), int(network.broadcast_address)]
+        elif network is not None and network.num_addresses == 1:
+            clauses.append("ip_address = ?")
+            params.append(str(network.network_address))
+        else:
+            # FTS5 yang menjadi sumber agar urutan rowid DESC + LIMIT tidak perlu sort
+            source = "devices_fts JOIN devices ON devices.id = devices_fts.rowid"
+            order_column = "devices_fts.rowid"
+            clauses.append("devices_fts MATCH ?")
+            params.append(build_fts_query(q))
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if area:
+        clauses.append("devices.linked_area = ?")
+        params.append(area)
+    if detected_after:
+        clauses.append("detected_at >= ?")
+        params.append(detected_after)
+    if after is not None:
+        clauses.append(f"{order_column} {'<' if descending else '>'} ?")
+        params.append(after)
+
+    sql = f"SELECT devices.* FROM {source}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {order_column} {'DESC' if descending else 'ASC'}"
+    if limit is not None:
+        # Ambil satu baris ekstra untuk mengetahui apakah masih ada halaman berikutnya
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    cursor = get_db().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(sql, params)
     devices = [dict(row) for row in cursor.fetchall()]
+
+    next_cursor = None
+    if limit is not None and len(devices) > limit:
+        devices = devices[:limit]
+        next_cursor = devices[-1]['ip_int' if order_column == 'ip_int' else 'id']
+    return devices, next_cursor
+
+def upsert_devices(cursor, devices, reported_at, seq, from_import=False):
+    """Meng-upsert satu batch perangkat lewat tabel sementara dan mengembalikan jumlah inserted/updated/unchanged.
+
+    Laporan agen memperbarui status & detected_at (dari epoch reported_at) dan mencatat observasi;
+    impor (from_import=True) juga memperbarui kolom inventaris dan mempertahankan status lama jika kosong.
+    """
+    rows = {}
+    for device in devices:
+        ip = device.get('ip_address')
+        if not ip:
+            continue
+        # IP yang sama dalam satu laporan: entri terakhir yang dipakai
+        default_name = f"Device-{ip.split('.')[-1]}"
+        if from_import:
+            # Kolom kosong diisi dari data lama (atau default) setelah batch dimuat
+            rows[ip] = (ip, ip_to_int(ip), device.get('name'), device.get('location'), device.get('status'),
+                        device.get('linked_area'), device.get('latitude'), device.get('longitude'), default_name,
+                        device.get('status'))
+        else:
+            rows[ip] = (
+                ip,
+                ip_to_int(ip),
+                device.get('name') or default_name,
+                device.get('location', 'Auto-Discovered'),
+                device.get('status') or 'Allowed',
+                device.get('linked_area', 'Internal-LAN'),
+                device.get('latitude'),
+                device.get('longitude'),
+                default_name,
+                device.get('status') or 'Allowed',
+            )
+
+    # Status kebijakan diterapkan setelah status efektif diketahui (lihat di bawah).
+    # Status asli disimpan di reported_status agar bisa dipulihkan saat aturan dihapus.
+    engine = get_policy_engine(cursor)
+    ips = list(rows)
+    policy_statuses = engine.classify_statuses(ips) if engine.rule_count else [None] * len(ips)
+
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS report_batch (
+            ip_address TEXT PRIMARY KEY,
+            ip_int INTEGER,
+            name TEXT,
+            location TEXT,
+            status TEXT,
+            linked_area TEXT,
+            latitude REAL,
+            longitude REAL,
+            default_name TEXT,
+            reported_status TEXT,
+            policy_status TEXT,
+            existed INTEGER,
+            prev_status TEXT
+        )
+    """)
+    cursor.execute("DELETE FROM report_batch")
+    cursor.executemany("""
+        INSERT INTO report_batch (ip_address, ip_int, name, location, status, linked_area, latitude, longitude,
+                                  default_name, reported_status, policy_status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [row + (status,) for row, status in zip(rows.values(), policy_statuses)])
+
+    # Simpan kondisi sebelum upsert agar bisa dihitung dan dikirim ke stream
+    cursor.execute("""
+        UPDATE report_batch SET
+            existed = EXISTS (SELECT 1 FROM devices d WHERE d.ip_address = report_batch.ip_address),
+            prev_status = (SELECT d.status FROM devices d WHERE d.ip_address = report_batch.ip_address)
+    """)
+    if from_import:
+        cursor.execute("""
+            UPDATE report_batch SET
+                name = COALESCE(name, (SELECT d.name FROM devices d WHERE d.ip_address = report_batch.ip_address),
+                                default_name),
+                location = COALESCE(location, (SELECT d.location FROM devices d
+                                               WHERE d.ip_address = report_batch.ip_address), 'Auto-Discovered'),
+                linked_area = COALESCE(linked_area, (SELECT d.linked_area FROM devices d
+                                                     WHERE d.ip_address = report_batch.ip_address), 'Internal-LAN'),
+                reported_status = COALESCE(reported_status, (SELECT d.reported_status FROM devices d
+                                                             WHERE d.ip_address = report_batch.ip_address),
+                                           prev_status, 'Allowed'),
+                status = COALESCE(status, (SELECT d.reported_status FROM devices d
+                                           WHERE d.ip_address = report_batch.ip_address), prev_status, 'Allowed')
+        """)
+    # Kebijakan server menentukan status akhir; host Offline tetap Offline, termasuk baris impor
+    # tanpa status yang tersimpan Offline
+    cursor.execute("UPDATE report_batch SET status = policy_status WHERE policy_status IS NOT NULL AND status IS NOT ?",
+                   (OFFLINE_STATUS,))
+    cursor.execute("""
+        SELECT
+            COALESCE(SUM(NOT existed), 0),
+            COALESCE(SUM(existed AND prev_status IS NOT status), 0),
+            COALESCE(SUM(existed AND prev_status IS status), 0)
+        FROM report_batch
+    """)
+    inserted, updated, unchanged = cursor.fetchone()
+
+    if from_import:
+        updates = """
+            name = excluded.name,
+            location = excluded.location,
+            status = excluded.status,
+            reported_status = excluded.reported_status,
+            linked_area = excluded.linked_area,
+            latitude = COALESCE(excluded.latitude, devices.latitude),
+            longitude = COALESCE(excluded.longitude, devices.longitude),
+            updated_seq = excluded.updated_seq
+        """
+    else:
+        updates = """
+            status = excluded.status,
+            reported_status = excluded.reported_status,
+            detected_at = excluded.detected_at,
+            updated_seq = excluded.updated_seq
+        """
+    # "WHERE true" diperlukan agar ON CONFLICT tidak dibaca sebagai bagian dari SELECT
+    cursor.execute(f"""
+        INSERT INTO devices (name, ip_address, ip_int, location, status, reported_status, detected_at,
+                             linked_area, latitude, longitude, updated_seq)
+        SELECT name, ip_address, ip_int, location, status, reported_status, ?, linked_area, latitude, longitude, ?
+        FROM report_batch WHERE true
+        ON CONFLICT(ip_address) DO UPDATE SET {updates}
+    """, (format_detected_at(reported_at), seq))
+
+    if not from_import:
+        # Observasi riwayat ditulis dalam batch & transaksi yang sama
+        record_observations(cursor, reported_at, "report_batch", STATUS_CODE_SQL.format(column='d.status'))
+
+    return {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+
+def record_observations(cursor, observed_at, source, status_code_sql, where="", params=()):
+    """Mencatat satu observasi riwayat per perangkat yang cocok dengan ip_address baris `source` (alias s)."""
+    # CROSS JOIN memaksa `source` sebagai loop luar; tanpa statistik tabel sementara
+    # planner SQLite memilih scan seluruh devices untuk batch kecil.
+    cursor.execute(f"""
+        INSERT INTO device_observations (device_id, observed_at, ip_int, status_code)
+        SELECT d.id, ?, d.ip_int, {status_code_sql}
+        FROM {source} s CROSS JOIN devices d ON d.ip_address = s.ip_address
+        {where}
+    """, (observed_at, *params))
+
+def get_reported_changes(cursor):
+    """Mengembalikan baris perangkat baru atau yang statusnya berubah pada batch terakhir."""
+    cursor = row_cursor(cursor)
+    cursor.execute("""
+        SELECT d.* FROM report_batch b CROSS JOIN devices d ON d.ip_address = b.ip_address
+        WHERE NOT b.existed OR b.prev_status IS NOT b.status
+        ORDER BY d.id DESC
+    """)
+    return [dict(row) for row in cursor.fetchall()]
+
+def apply_delta_report(cursor, report, agent_id, reported_at, seq):
+    """Menerapkan laporan delta agen ({"format": "delta", "shard", "full", "upserts", "removed", "checksum"}).
+
+    Host yang hilang ditandai OFFLINE_STATUS; checksum yang tidak cocok mengembalikan resync=True.
+    """
+    shard = str(report.get('shard') or '*')
+    upserts = [device for device in report.get('upserts') or [] if device.get('ip_address')]
+    current = {device['ip_address'] for device in upserts}
+    removed = set(report.get('removed') or []) - current
+
+    cursor.execute("SELECT ip_address FROM agent_hosts WHERE agent_id = ? AND shard = ? AND present",
+                   (agent_id, shard))
+    known = {row[0] for row in cursor.fetchall()}
+    if report.get('full'):
+        # Laporan penuh menggantikan seluruh isi shard
+        removed |= known - current
+    removed &= known
+
+    offline = [{'ip_address': ip, 'status': OFFLINE_STATUS} for ip in sorted(removed)]
+    counts = upsert_devices(cursor, upserts + offline, reported_at, seq)
+
+    # Host yang hilang tetap dicatat (present = 0) agar terus mendapat sampel Offline
+    cursor.executemany("UPDATE agent_hosts SET present = 0 WHERE agent_id = ? AND shard = ? AND ip_address = ?",
+                       [(agent_id, shard, ip) for ip in removed])
+    cursor.executemany("""
+        INSERT INTO agent_hosts (agent_id, shard, ip_address, present) VALUES (?, ?, ?, 1)
+        ON CONFLICT (agent_id, shard, ip_address) DO UPDATE SET present = 1
+    """, [(agent_id, shard, ip) for ip in current - known])
+
+    resync = False
+    if report.get('checksum'):
+        expected = host_checksum((known - removed) | current)
+        resync = expected != report['checksum']
+
+    # Setiap laporan juga heartbeat: host shard lain mendapat detected_at baru dan satu observasi per siklus.
+    # updated_seq hanya dinaikkan pada laporan checksum agar ?since= tidak banjir perubahan; host yang
+    # menurut agen ini sudah hilang tetap dicatat Offline walau laporan lain menandai IP tersebut aktif.
+    refresh_seq = ", updated_seq = ?" if report.get('checksum') else ""
+    cursor.execute(f"""
+        UPDATE devices SET detected_at = ?{refresh_seq}
+        WHERE ip_address IN (SELECT ip_address FROM agent_hosts
+                             WHERE agent_id = ? AND shard = ? AND present
+                               AND ip_address NOT IN (SELECT ip_address FROM report_batch))
+    """, (format_detected_at(reported_at), *((seq,) if refresh_seq else ()), agent_id, shard))
+    status_code_sql = (f"CASE WHEN s.present THEN {STATUS_CODE_SQL.format(column='d.status')} "
+                       f"ELSE {STATUS_CODES[OFFLINE_STATUS]} END")
+    record_observations(cursor, reported_at, "agent_hosts", status_code_sql, """
+        WHERE s.agent_id = ? AND s.shard = ? AND s.ip_address NOT IN (SELECT ip_address FROM report_batch)
+    """, (agent_id, shard))
+    return {**counts, "removed": len(removed), "shard": shard, "resync": resync}
+
+REPORT_DEVICE_FIELDS = ('name', 'location', 'status', 'linked_area', 'latitude', 'longitude')
+
+def validate_report(report):
+    """Memeriksa bentuk laporan agen sebelum transaksi tulis; mengembalikan pesan error atau None."""
+    if isinstance(report, list):
+        # Format lama: entri tanpa ip_address dilewati oleh upsert_devices
+        devices, require_ip = report, False
+    elif isinstance(report, dict):
+        if report.get('format') != DELTA_FORMAT:
+            return "Unsupported report format"
+        devices, require_ip = report.get('upserts') or [], True
+        removed = report.get('removed') or []
+        if not isinstance(devices, list):
+            return "'upserts' must be a list"
+        if not isinstance(removed, list) or not all(isinstance(ip, str) for ip in removed):
+            return "'removed' must be a list of IP address strings"
+    else:
+        return "Report must be a JSON object or list"
+    for device in devices:
+        if not isinstance(device, dict):
+            return "Each device must be a JSON object"
+        ip = device.get('ip_address')
+        if (require_ip or ip is not None) and not isinstance(ip, str):
+            return "Each device must have a string 'ip_address'"
+        if not all(isinstance(device.get(field), (str, int, float, type(None))) for field in REPORT_DEVICE_FIELDS):
+            return "Device fields must be strings or numbers"
+    return None
+
+def read_report_body():
+    """Membaca body JSON laporan agen, mendukung Content-Encoding: gzip.
+
+    Body (sebelum maupun sesudah dekompresi) dibatasi MAX_REPORT_BYTES agar gzip bomb tidak
+    menghabiskan memori; melempar RequestEntityTooLarge jika batas terlampaui.
+    """
+    if request.content_length is not None and request.content_length > MAX_REPORT_BYTES:
+        raise RequestEntityTooLarge()
+    data = request.get_data()
+    if request.content_encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = decompressor.decompress(data, MAX_REPORT_BYTES)
+        if decompressor.unconsumed_tail:
+            raise RequestEntityTooLarge()
+        data += decompressor.flush()
+        if len(data) > MAX_REPORT_BYTES:
+            raise RequestEntityTooLarge()
+        if not decompressor.eof:
+            raise ValueError("Truncated gzip body")
+    return json.loads(data) if data else None
+
+# --- Device History (rollup & retensi) ---
+def run_rollups(conn, batch_size=ROLLUP_BATCH_SIZE, pause=ROLLUP_BATCH_PAUSE_SECONDS):
+    """Memproses observasi baru (setelah watermark) menjadi rollup jam/hari; mengembalikan jumlahnya.
+
+    Satu transaksi per batch (rollup & watermark konsisten), dengan jeda `pause` detik antar-batch.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS rollup_batch (
+            obs_id INTEGER PRIMARY KEY,
+            device_id INTEGER,
+            observed_at INTEGER,
+            status_code INTEGER,
+            changed INTEGER
+        )
+    """)
+    processed = 0
+    while True:
+        begin_write(conn)
+        watermark = get_sync_version(cursor, 'rollup_watermark')
+        cursor.execute("DELETE FROM rollup_batch")
+        # Flap = status berbeda dari observasi sebelumnya (di batch ini atau dari rollup sebelumnya)
+        cursor.execute("""
+            INSERT INTO rollup_batch (obs_id, device_id, observed_at, status_code, changed)
+            SELECT o.id, o.device_id, o.observed_at, o.status_code,
+                   COALESCE(LAG(o.status_code) OVER w, s.last_status, o.status_code) != o.status_code
+            FROM (SELECT * FROM device_observations WHERE id > ? ORDER BY id LIMIT ?) o
+            LEFT JOIN device_rollup_state s ON s.device_id = o.device_id
+            WINDOW w AS (PARTITION BY o.device_id ORDER BY o.observed_at, o.id)
+        """, (watermark, batch_size))
+        count = cursor.rowcount
+        if count <= 0:
+            conn.commit()
+            break
+
+        for period in ROLLUP_PERIODS.values():
+            cursor.execute("""
+                INSERT INTO device_uptime (device_id, period, bucket, samples, up_samples, status_changes)
+                SELECT device_id, ?, observed_at / ? * ?, COUNT(*), SUM(status_code != 0), SUM(changed)
+                FROM rollup_batch GROUP BY device_id, observed_at / ?
+                ON CONFLICT (device_id, period, bucket) DO UPDATE SET
+                    samples = samples + excluded.samples,
+                    up_samples = up_samples + excluded.up_samples,
+                    status_changes = status_changes + excluded.status_changes
+            """, (period, period, period, period))
+            cursor.execute("""
+                INSERT INTO fleet_uptime (period, bucket, samples, up_samples, status_changes)
+                SELECT ?, observed_at / ? * ?, COUNT(*), SUM(status_code != 0), SUM(changed)
+                FROM rollup_batch GROUP BY observed_at / ?
+                ON CONFLICT (period, bucket) DO UPDATE SET
+                    samples = samples + excluded.samples,
+                    up_samples = up_samples + excluded.up_samples,
+                    status_changes = status_changes + excluded.status_changes
+            """, (period, period, period, period))
+
+        # Kolom "bare" bersama MAX() di SQLite diambil dari baris dengan obs_id terbesar
+        cursor.execute("""
+            INSERT INTO device_rollup_state (device_id, last_status, last_observed, last_seen)
+            SELECT b.device_id, b.status_code, b.observed_at, u.last_seen
+            FROM (SELECT device_id, status_code, observed_at, MAX(obs_id) FROM rollup_batch GROUP BY device_id) b
+            LEFT JOIN (SELECT device_id, MAX(observed_at) AS last_seen FROM rollup_batch
+                       WHERE status_code != 0 GROUP BY device_id) u ON u.device_id = b.device_id
+            WHERE true
+            ON CONFLICT (device_id) DO UPDATE SET
+                last_status = excluded.last_status,
+                last_observed = excluded.last_observed,
+                last_seen = COALESCE(excluded.last_seen, last_seen)
+        """)
+        cursor.execute("UPDATE sync_state SET value = (SELECT MAX(obs_id) FROM rollup_batch) "
+                       "WHERE key = 'rollup_watermark'")
+        conn.commit()
+        processed += count
+        time.sleep(pause)
+    return processed
+
+def prune_history(conn, now=None, chunk=100000):
+    """Menghapus observasi mentah dan rollup yang melewati RETENTION_SECONDS.
+
+    Observasi hanya dihapus jika sudah masuk rollup (id <= watermark). Karena observasi ditambahkan
+    berurutan waktu, penghapusan berjalan dari awal tabel per chunk tanpa perlu indeks observed_at.
+    """
+    now = int(now or time.time())
+    cursor = conn.cursor()
+    watermark = get_sync_version(cursor, 'rollup_watermark')
+    cutoff = now - RETENTION_SECONDS['raw']
+    deleted = 0
+    while True:
+        begin_write(conn)
+        cursor.execute("SELECT id, observed_at FROM device_observations WHERE id <= ? "
+                       "ORDER BY id LIMIT 1 OFFSET ?", (watermark, chunk - 1))
+        row = cursor.fetchone()
+        if row and row[1] < cutoff:
+            cursor.execute("DELETE FROM device_observations WHERE id <= ?", (row[0],))
+            deleted += cursor.rowcount
+            conn.commit()
+            continue
+        # Chunk terakhir: batasi ke id chunk tersebut (atau watermark) dan periksa waktunya per baris
+        limit_id = row[0] if row else watermark
+        cursor.execute("DELETE FROM device_observations WHERE id <= ? AND observed_at < ?", (limit_id, cutoff))
+        deleted += cursor.rowcount
+        break
+
+    for name, period in ROLLUP_PERIODS.items():
+        cursor.execute("DELETE FROM device_uptime WHERE period = ? AND bucket < ?",
+                       (period, now - RETENTION_SECONDS[name]))
+        cursor.execute("DELETE FROM fleet_uptime WHERE period = ? AND bucket < ?",
+                       (period, now - RETENTION_SECONDS[name]))
+    conn.commit()
+    return deleted
+
+def rollup_worker():
+    """Loop latar belakang: rollup lalu pruning setiap ROLLUP_INTERVAL_SECONDS."""
+    init_db()
+    while True:
+        conn = db.connect(DB_NAME)
+        try:
+            run_rollups(conn)
+            prune_history(conn)
+        except Exception as e:
+            print(f"Error running history rollups: {e}")
+        finally:
+            conn.close()
+        time.sleep(ROLLUP_INTERVAL_SECONDS)
+
+_rollup_thread = None
+_rollup_lock = threading.Lock()
+
+def start_rollup_worker():
+    """Menjalankan rollup_worker sekali per proses (thread lama tidak ikut ke proses hasil fork)."""
+    global _rollup_thread
+    with _rollup_lock:
+        if _rollup_thread is None or not _rollup_thread.is_alive():
+            _rollup_thread = threading.Thread(target=rollup_worker, name="rollup-worker", daemon=True)
+            _rollup_thread.start()
+        return _rollup_thread
+
+def parse_history_range():
+    """Membaca ?period=hour|day&from=<epoch>&to=<epoch>; default 24 jam atau 30 hari terakhir."""
+    name = request.args.get('period', 'hour')
+    if name not in ROLLUP_PERIODS:
+        return None
+    period = ROLLUP_PERIODS[name]
+    end = request.args.get('to', type=int) or int(time.time())
+    start = request.args.get('from', type=int) or end - (86400 if name == 'hour' else 30 * 86400)
+    return name, period, start // period * period, end
+
+def format_uptime_rows(rows):
+    buckets = []
+    for bucket, samples, up_samples, status_changes in rows:
+        buckets.append({
+            "bucket": bucket,
+            "samples": samples,
+            "up_samples": up_samples,
+            "uptime": round(up_samples / samples, 4) if samples else None,
+            "status_changes": status_changes,
+        })
+    samples = sum(item["samples"] for item in buckets)
+    summary = {
+        "samples": samples,
+        "uptime": round(sum(item["up_samples"] for item in buckets) / samples, 4) if samples else None,
+        "status_changes": sum(item["status_changes"] for item in buckets),
+    }
+    return buckets, summary
+
+# --- Inventory Import ---
+def run_import_job(job_id, path):
+    """Mengimpor file secara streaming dalam transaksi per IMPORT_CHUNK_ROWS baris lewat upsert_devices."""
+    conn = db.connect(DB_NAME)
+    cursor = conn.cursor()
+    progress = {'processed': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors_saved': 0}
+
+    def flush(devices, errors):
+        begin_write(conn)
+        seq = next_sync_version(cursor)
+        changes = []
+        if devices:
+            counts = upsert_devices(cursor, devices, int(time.time()), seq, from_import=True)
+            progress['inserted'] += counts['inserted']
+            progress['updated'] += counts['updated'] + counts['unchanged']
+            changes = get_reported_changes(cursor) if broadcaster.subscribers else []
+        progress['failed'] += len(errors)
+        saved = errors[:max(0, MAX_IMPORT_ERRORS - progress['errors_saved'])]
+        cursor.executemany("INSERT OR REPLACE INTO import_errors (job_id, row_number, error) VALUES (?, ?, ?)",
+                           [(job_id, row_number, error) for row_number, error in saved])
+        progress['errors_saved'] += len(saved)
+        cursor.execute("""
+            UPDATE import_jobs SET rows_processed = ?, rows_inserted = ?, rows_updated = ?, rows_failed = ?
+            WHERE id = ?
+        """, (progress['processed'], progress['inserted'], progress['updated'], progress['failed'], job_id))
+        conn.commit()
+        if changes:
+            broadcaster.publish("devices", {"version": seq, "devices": changes})
+
+    try:
+        cursor.execute("UPDATE import_jobs SET status = 'running', rows_total = ? WHERE id = ?",
+                       (importer.count_rows(path), job_id))
+        conn.commit()
+        devices, errors = [], []
+        for row_number, raw in importer.iter_rows(path):
+            try:
+                devices.append(importer.normalize_row(raw))
+            except ValueError as e:
+                errors.append((row_number, str(e)))
+            progress['processed'] += 1
+            if len(devices) + len(errors) >= IMPORT_CHUNK_ROWS:
+                flush(devices, errors)
+                devices, errors = [], []
+        flush(devices, errors)
+        status, error = 'completed', None
+    except Exception as e:
+        conn.rollback()
+        print(f"Error importing {path}: {e}")
+        status, error = 'failed', str(e)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    cursor.execute("UPDATE import_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                   (status, error, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), job_id))
+    conn.commit()
     conn.close()
-    return devices
+
+def get_import_job_from_db(job_id):
+    cursor = get_db().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute("SELECT * FROM import_jobs WHERE id = ?", (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    if job['status'] == 'completed':
+        job['progress'] = 1.0
+    else:
+        job['progress'] = round(job['rows_processed'] / job['rows_total'], 4) if job['rows_total'] else None
+    return job
+
+# --- Device Stream (Server-Sent Events) ---
+class StreamSubscriber:
+    """Buffer event terbatas untuk satu klien SSE."""
+
+    RESYNC = "event: resync\ndata: {}\n\n"
+
+    def __init__(self, max_buffer):
+        self.max_buffer = max_buffer
+        self.buffer = deque()
+        self.condition = threading.Condition()
+
+    def push(self, message):
+        with self.condition:
+            if len(self.buffer) >= self.max_buffer:
+                # Klien terlalu lambat: buang antrean dan minta sinkron ulang lewat ?since=
+                self.buffer.clear()
+                message = self.RESYNC
+            self.buffer.append(message)
+            self.condition.notify()
+
+    def pop(self, timeout):
+        """Menunggu event berikutnya; None jika timeout."""
+        with self.condition:
+            if not self.buffer:
+                self.condition.wait(timeout)
+            return self.buffer.popleft() if self.buffer else None
+
+class DeviceBroadcaster:
+    """Menyebarkan event ke semua klien SSE dalam satu proses, tanpa polling SQLite."""
+
+    def __init__(self, max_buffer=SSE_CLIENT_BUFFER):
+        self.max_buffer = max_buffer
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = StreamSubscriber(self.max_buffer)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        # Serialisasi sekali untuk semua klien
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.push(message)
+
+broadcaster = DeviceBroadcaster()
+
+# --- Request Metrics ---
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    db.reset_query_stats()
+    # Worker dimulai oleh proses yang melayani request, apa pun servernya (flask run, WSGI, app.py)
+    if ROLLUP_WORKER and (_rollup_thread is None or not _rollup_thread.is_alive()):
+        start_rollup_worker()
+
+@app.after_request
+def record_request_metrics(response):
+    # Untuk stream SSE yang terukur adalah waktu sampai respons mulai dikirim
+    started = g.get('request_started')
+    if started is not None:
+        route = f"{request.method} {request.url_rule.rule}" if request.url_rule else "unmatched"
+        sql_seconds, sql_queries = db.get_query_stats()
+        metrics.observe_request(route, response.status_code, time.perf_counter() - started,
+                                sql_seconds, sql_queries, g.get('rows_serialized', 0))
+    return response
 
 # --- API Routes ---
 @app.route('/api/login', methods=['POST'])
@@ -62,51 +1135,305 @@ def login():
 
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
-    devices_list = get_all_devices_from_db()
-    return jsonify({"devices": devices_list})
+    since = request.args.get('since', type=int)
+
+    # Versi dibaca lebih dulu: dashboard yang idle cukup mendapat 304 tanpa serialisasi
+    version = get_sync_version(get_db().cursor())
+    etag = f"{version}-{zlib.crc32(request.query_string):08x}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    search_args = {
+        'q': request.args.get('q', '').strip() or None,
+        'status': request.args.get('status') or None,
+        'area': request.args.get('area') or None,
+        'detected_after': request.args.get('detected_after') or None,
+        'after': request.args.get('after', type=int),
+        'limit': request.args.get('limit', type=int),
+    }
+    if search_args['limit'] is not None:
+        search_args['limit'] = max(1, min(search_args['limit'], MAX_PAGE_SIZE))
+
+    if since is not None:
+        devices_list, deleted = get_device_changes_from_db(since)
+        payload = {"devices": devices_list, "deleted": deleted, "version": version}
+    elif any(value is not None for value in search_args.values()):
+        try:
+            devices_list, next_cursor = search_devices_from_db(**search_args)
+        except sqlite3.OperationalError:
+            return jsonify({"error": "Invalid search query"}), 400
+        payload = {"devices": devices_list, "next_cursor": next_cursor, "version": version}
+    else:
+        payload = {"devices": get_all_devices_from_db(), "version": version}
+
+    record_rows_serialized(len(payload["devices"]))
+    response = jsonify(payload)
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/devices/stream', methods=['GET'])
+def stream_devices():
+    # Stream tidak lewat get_db(), jadi skema dipastikan di sini (bisa jadi request pertama proses)
+    if not _schema_ready:
+        init_db()
+
+    def generate():
+        subscriber = broadcaster.subscribe()
+        try:
+            # Versi awal dikirim setelah subscribe agar klien bisa mengejar lewat ?since=.
+            # Koneksi langsung dikembalikan ke pool, tidak ditahan selama stream terbuka.
+            with db_pool.connection() as conn:
+                version = get_sync_version(conn.cursor())
+            yield f"retry: 3000\nevent: hello\ndata: {json.dumps({'version': version})}\n\n"
+            while True:
+                message = subscriber.pop(SSE_HEARTBEAT_SECONDS)
+                yield message if message is not None else ": keepalive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/devices/<int:device_id>/history', methods=['GET'])
+def get_device_history(device_id):
+    history_range = parse_history_range()
+    if history_range is None:
+        return jsonify({"error": "period must be 'hour' or 'day'"}), 400
+    name, period, start, end = history_range
+
+    cursor = get_db().cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute("SELECT id, name, ip_address, status, detected_at FROM devices WHERE id = ?", (device_id,))
+    device = cursor.fetchone()
+    if device is None:
+        return jsonify({"error": "Device not found"}), 404
+    cursor.execute("SELECT last_seen, last_observed FROM device_rollup_state WHERE device_id = ?", (device_id,))
+    state = cursor.fetchone()
+    cursor.execute("""
+        SELECT bucket, samples, up_samples, status_changes FROM device_uptime
+        WHERE device_id = ? AND period = ? AND bucket BETWEEN ? AND ?
+        ORDER BY bucket
+    """, (device_id, period, start, end))
+    buckets, summary = format_uptime_rows(cursor.fetchall())
+    record_rows_serialized(len(buckets))
+
+    return jsonify({
+        "device": dict(device),
+        "last_seen": state["last_seen"] if state else None,
+        "last_observed": state["last_observed"] if state else None,
+        "period": name,
+        "from": start,
+        "to": end,
+        "buckets": buckets,
+        "summary": summary,
+    })
+
+@app.route('/api/stats/uptime', methods=['GET'])
+def get_uptime_stats():
+    history_range = parse_history_range()
+    if history_range is None:
+        return jsonify({"error": "period must be 'hour' or 'day'"}), 400
+    name, period, start, end = history_range
+
+    cursor = get_db().cursor()
+    cursor.execute("""
+        SELECT bucket, samples, up_samples, status_changes FROM fleet_uptime
+        WHERE period = ? AND bucket BETWEEN ? AND ?
+        ORDER BY bucket
+    """, (period, start, end))
+    buckets, summary = format_uptime_rows(cursor.fetchall())
+    record_rows_serialized(len(buckets))
+
+    return jsonify({"period": name, "from": start, "to": end, "buckets": buckets, "summary": summary})
+
+@app.route('/api/upload_excel', methods=['POST'])
+def upload_excel():
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({"error": "No file uploaded"}), 400
+    extension = os.path.splitext(file.filename)[1].lower()
+    if extension not in importer.SUPPORTED_EXTENSIONS:
+        return jsonify({"error": "Only .xlsx, .xlsm and .csv files are supported"}), 400
+
+    # File disimpan ke disk (streaming) lalu diproses di thread latar belakang
+    job_id = uuid.uuid4().hex
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    path = os.path.join(UPLOAD_FOLDER, f"{job_id}{extension}")
+    file.save(path)
+
+    conn = get_db()
+    begin_write(conn)
+    conn.execute("INSERT INTO import_jobs (id, filename, status, created_at) VALUES (?, ?, 'queued', ?)",
+                 (job_id, file.filename, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+    threading.Thread(target=run_import_job, args=(job_id, path), daemon=True).start()
+
+    return jsonify({
+        "success": True,
+        "message": f"Import of {file.filename} started.",
+        "job_id": job_id,
+        "status_url": f"/api/upload_excel/{job_id}",
+    }), 202
+
+@app.route('/api/upload_excel/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    job = get_import_job_from_db(job_id)
+    if job is None:
+        return jsonify({"error": "Import job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/upload_excel/<job_id>/errors', methods=['GET'])
+def get_import_errors(job_id):
+    if get_import_job_from_db(job_id) is None:
+        return jsonify({"error": "Import job not found"}), 404
+    after = request.args.get('after', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 100, type=int), MAX_PAGE_SIZE))
+
+    cursor = get_db().cursor()
+    cursor.execute("""
+        SELECT row_number, error FROM import_errors WHERE job_id = ? AND row_number > ?
+        ORDER BY row_number LIMIT ?
+    """, (job_id, after, limit + 1))
+    rows = cursor.fetchall()
+
+    errors = [{"row": row_number, "error": error} for row_number, error in rows[:limit]]
+    record_rows_serialized(len(errors))
+    next_cursor = errors[-1]["row"] if len(rows) > limit else None
+    return jsonify({"errors": errors, "next_cursor": next_cursor})
+
+@app.route('/api/policies', methods=['GET'])
+def get_policies():
+    cursor = get_db().cursor()
+    version = get_sync_version(cursor, 'policies')
+    etag = f"policies-{version}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    policies = get_policies_from_db(cursor)
+    record_rows_serialized(len(policies))
+
+    response = jsonify({"policies": policies, "version": version})
+    response.set_etag(etag)
+    return response
+
+def commit_policy_change(conn, cursor):
+    """Menerapkan ulang kebijakan ke perangkat, commit, lalu mengirim perubahan status ke stream."""
+    seq = next_sync_version(cursor)
+    changed = apply_policies_to_devices(cursor, load_policy_engine(cursor), seq)
+    devices = []
+    if changed and broadcaster.subscribers:
+        rows = row_cursor(cursor)
+        rows.execute("SELECT * FROM devices WHERE updated_seq = ? ORDER BY id DESC", (seq,))
+        devices = [dict(row) for row in rows.fetchall()]
+    conn.commit()
+    if devices:
+        broadcaster.publish("devices", {"version": seq, "devices": devices})
+    return changed
+
+@app.route('/api/policies', methods=['POST'])
+def add_policies():
+    data = request.get_json(silent=True)
+    rules = data if isinstance(data, list) else [data] if isinstance(data, dict) else None
+    if not rules:
+        return jsonify({"error": "No policy received"}), 400
+    if not all(isinstance(rule, dict) for rule in rules):
+        return jsonify({"error": "Each policy must be a JSON object"}), 400
+    try:
+        for rule in rules:
+            parse_rule(rule)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid policy: {e}"}), 400
+
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        begin_write(conn)
+        ids = []
+        for rule in rules:
+            cursor.execute("""
+                INSERT INTO ip_policies (action, cidr, start_ip, end_ip, priority, description)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (str(rule['action']).lower(), rule.get('cidr'), rule.get('start_ip'), rule.get('end_ip'),
+                  rule.get('priority'), rule.get('description')))
+            ids.append(cursor.lastrowid)
+        changed = commit_policy_change(conn, cursor)
+        return jsonify({"success": True, "ids": ids, "devices_changed": changed}), 201
+    except Exception as e:
+        conn.rollback()
+        print(f"Error saving policies: {e}")
+        return jsonify({"error": "Failed to save policies."}), 500
+
+@app.route('/api/policies/<int:policy_id>', methods=['DELETE'])
+def delete_policy(policy_id):
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        begin_write(conn)
+        cursor.execute("DELETE FROM ip_policies WHERE id = ?", (policy_id,))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return jsonify({"error": "Policy not found"}), 404
+        changed = commit_policy_change(conn, cursor)
+        return jsonify({"success": True, "devices_changed": changed})
+    except Exception as e:
+        conn.rollback()
+        print(f"Error deleting policy: {e}")
+        return jsonify({"error": "Failed to delete policy."}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Latensi per route, waktu SQL, baris terserialisasi, lock wait dan status pool koneksi."""
+    return jsonify({**metrics.snapshot(), "db_pool": db_pool.stats(), "schema_version": SCHEMA_VERSION})
 
 @app.route('/api/agent/report', methods=['POST'])
 def agent_report():
-    discovered_devices = request.json
-    if not discovered_devices:
+    try:
+        report = read_report_body()
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"Report body exceeds {MAX_REPORT_BYTES} bytes"}), 413
+    except (zlib.error, ValueError):
+        return jsonify({"error": "Invalid report body"}), 400
+    if not report:
         return jsonify({"error": "No data received"}), 400
+    error = validate_report(report)
+    if error:
+        return jsonify({"error": error}), 400
 
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     cursor = conn.cursor()
     
     try:
-        for device in discovered_devices:
-            ip = device.get('ip_address')
-            detected_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            cursor.execute("SELECT id FROM devices WHERE ip_address = ?", (ip,))
-            result = cursor.fetchone()
-
-            if result:
-                cursor.execute("UPDATE devices SET status = ?, detected_at = ? WHERE ip_address = ?", 
-                               (device.get('status'), detected_at, ip))
-            else:
-                cursor.execute("""
-                    INSERT INTO devices (name, ip_address, location, status, detected_at, linked_area)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    device.get('name', f"Device-{ip.split('.')[-1]}"),
-                    ip,
-                    device.get('location', 'Auto-Discovered'),
-                    device.get('status', 'Allowed'),
-                    detected_at,
-                    device.get('linked_area', 'Internal-LAN')
-                ))
-        
+        begin_write(conn)
+        # Satu epoch untuk seluruh laporan: observasi memakainya langsung, detected_at diformat darinya
+        reported_at = int(time.time())
+        # Versi berikutnya (aman karena kunci tulis sudah dipegang); baru disimpan jika ada baris
+        # yang ditulis dengan versi ini, jadi heartbeat kosong tidak membatalkan ETag/304 dashboard
+        seq = get_sync_version(cursor) + 1
+        if isinstance(report, list):
+            # Format lama: daftar lengkap perangkat
+            counts = upsert_devices(cursor, report, reported_at, seq)
+        else:
+            agent_id = str(report.get('agent_id') or request.remote_addr)
+            counts = apply_delta_report(cursor, report, agent_id, reported_at, seq)
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM devices WHERE updated_seq = ?)", (seq,))
+        if cursor.fetchone()[0]:
+            next_sync_version(cursor)
+        changes = get_reported_changes(cursor) if broadcaster.subscribers else []
         conn.commit()
-        return jsonify({"success": True, "message": "Report received and processed."})
+
+        # Satu event per laporan, dikirim setelah commit
+        if changes:
+            broadcaster.publish("devices", {"version": seq, "devices": changes})
+        return jsonify({"success": True, "message": "Report received and processed.", **counts})
 
     except Exception as e:
         conn.rollback()
         print(f"Error processing agent report: {e}")
         return jsonify({"error": "Failed to process report on the server."}), 500
-    finally:
-        conn.close()
 
 if __name__ == '__main__':
+    init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,607 @@
+"""Benchmark sederhana untuk backend Device Management.
+
+Jalankan dari folder backend, misalnya:
+    python benchmark.py report --sizes 256 4096 65536
+"""
+import argparse
+import gzip
+import http.client
+import json
+import logging
+import os
+import random
+import resource
+import sqlite3
+import selectors
+import signal
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+# Gunakan database sementara agar database.db asli tidak tersentuh
+_tmpdir = tempfile.mkdtemp(prefix="devmgmt-bench-")
+os.environ.setdefault("DATABASE_PATH", os.path.join(_tmpdir, "bench.db"))
+# Rollup diukur secara eksplisit oleh benchmark history, bukan oleh worker latar belakang
+os.environ.setdefault("ROLLUP_WORKER", "0")
+
+import agent  # noqa: E402
+import app as backend  # noqa: E402
+import policy  # noqa: E402
+
+
+def make_devices(count, status="Allowed", offset=0):
+    """Membuat payload perangkat palsu dengan IP unik di 10.0.0.0/8."""
+    devices = []
+    for i in range(offset, offset + count):
+        ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        devices.append({
+            'ip_address': ip,
+            'name': f"Device-{i}",
+            'status': status,
+            'location': 'Auto-Discovered',
+            'linked_area': 'Internal-LAN',
+        })
+    return devices
+
+
+def bench_report(sizes, repeat):
+    """Mengukur laporan/detik untuk /api/agent/report pada beberapa ukuran payload."""
+    client = backend.app.test_client()
+    print(f"{'devices':>8} {'reports/s':>10} {'devices/s':>12} {'first (ms)':>11} {'steady (ms)':>12}")
+    for size in sizes:
+        payloads = [
+            json.dumps(make_devices(size, status=("Allowed" if n % 2 == 0 else "Blocked"), offset=size * 10))
+            for n in range(repeat + 1)
+        ]
+        # Laporan pertama = semua insert, sisanya = update status
+        start = time.perf_counter()
+        response = client.post('/api/agent/report', data=payloads[0], content_type='application/json')
+        first = time.perf_counter() - start
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+        start = time.perf_counter()
+        for payload in payloads[1:]:
+            response = client.post('/api/agent/report', data=payload, content_type='application/json')
+            assert response.status_code == 200, response.get_data(as_text=True)
+        elapsed = time.perf_counter() - start
+
+        per_report = elapsed / repeat
+        print(f"{size:>8} {1 / per_report:>10.2f} {size / per_report:>12.0f} "
+              f"{first * 1000:>11.1f} {per_report * 1000:>12.1f}")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * pct / 100) - 1)]
+
+
+def populate(count, chunk=50000):
+    """Mengisi database benchmark dengan `count` perangkat lewat jalur upsert yang sama dengan agen."""
+    cities = ["Jakarta", "Bandung", "Surabaya", "Medan", "Makassar", "Denpasar", "Semarang", "Palembang"]
+    areas = ["Internal-LAN", "DMZ", "Guest-WiFi", "Datacenter", "Branch-Office"]
+    statuses = ["Allowed"] * 8 + ["Blocked", "Maintenance"]
+    rng = random.Random(42)
+    conn = sqlite3.connect(backend.DB_NAME)
+    cursor = conn.cursor()
+    for offset in range(0, count, chunk):
+        devices = make_devices(min(chunk, count - offset), offset=offset)
+        for device in devices:
+            device['location'] = f"{rng.choice(cities)} Site-{rng.randrange(200)}"
+            device['linked_area'] = rng.choice(areas)
+            device['status'] = rng.choice(statuses)
+        seq = backend.next_sync_version(cursor)
+        backend.upsert_devices(cursor, devices, int(time.time()), seq)
+        conn.commit()
+    conn.close()
+
+
+def bench_search(count, queries):
+    """Latensi p50/p99 GET /api/devices untuk pencarian dan pengambilan halaman."""
+    start = time.perf_counter()
+    populate(count)
+    print(f"populated {count} devices in {time.perf_counter() - start:.1f}s")
+
+    client = backend.app.test_client()
+    rng = random.Random(7)
+
+    def ip(n):
+        return f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"
+
+    cases = {
+        "search name (fts)": lambda: f"q=Device-{rng.randrange(count)}&limit=50",
+        "search location (fts)": lambda: f"q={rng.choice(['jakarta', 'band', 'site-12'])}&limit=50",
+        "search exact ip": lambda: f"q={ip(rng.randrange(count))}",
+        "search cidr /24": lambda: f"q={ip(rng.randrange(count))}/24",
+        "search cidr /16 page": lambda: f"q={ip(rng.randrange(count))}/16&limit=50",
+        "page first": lambda: "limit=50",
+        "page deep (cursor)": lambda: f"limit=50&after={rng.randrange(count)}",
+        "page status filter": lambda: f"status=Blocked&limit=50&after={rng.randrange(count)}",
+        "page area filter": lambda: f"area=DMZ&limit=50&after={rng.randrange(count)}",
+    }
+    print(f"{'case':<24} {'p50 (ms)':>9} {'p99 (ms)':>9} {'rows':>6}")
+    for name, make_query in cases.items():
+        timings, rows = [], 0
+        for _ in range(queries):
+            query = make_query()
+            began = time.perf_counter()
+            response = client.get(f"/api/devices?{query}")
+            timings.append((time.perf_counter() - began) * 1000)
+            assert response.status_code == 200, response.get_data(as_text=True)
+            rows += len(response.json['devices'])
+        print(f"{name:<24} {statistics.median(timings):>9.2f} {percentile(timings, 99):>9.2f} "
+              f"{rows / queries:>6.0f}")
+
+
+class FakeScanner:
+    """Backend pemindai palsu untuk agent.scan_networks: tanpa jaringan, latensi per shard tetap."""
+
+    def __init__(self, latency, alive_ratio):
+        self.latency = latency
+        self.alive_every = max(1, int(1 / alive_ratio)) if alive_ratio > 0 else 0
+
+    def scan(self, network_cidr, timeout):
+        from ipaddress import ip_network
+        time.sleep(self.latency)
+        if not self.alive_every:
+            return []
+        hosts = ip_network(network_cidr).hosts()
+        return [(str(host), "") for n, host in enumerate(hosts) if n % self.alive_every == 0]
+
+
+def bench_scan(cidrs, concurrencies, latency, alive_ratio):
+    """Throughput pemindaian (hosts/detik) agent.scan_networks untuk beberapa tingkat konkurensi."""
+    scanner = FakeScanner(latency, alive_ratio)
+    print(f"cidrs: {', '.join(cidrs)}; fake latency {latency * 1000:.0f} ms/shard")
+    print(f"{'workers':>8} {'shards':>7} {'hosts/s':>10} {'found':>8} {'first shard (s)':>16} {'total (s)':>10}")
+    for concurrency in concurrencies:
+        first = []
+        started = time.perf_counter()
+
+        def on_shard(shard, devices):
+            if not first:
+                first.append(time.perf_counter() - started)
+
+        stats = agent.scan_networks(cidrs, on_shard, scanner=scanner, concurrency=concurrency)
+        print(f"{concurrency:>8} {stats['shards']:>7} {stats['addresses'] / stats['elapsed']:>10.0f} "
+              f"{stats['hosts_found']:>8} {first[0] if first else 0:>16.2f} {stats['elapsed']:>10.2f}")
+
+
+def bench_policy(address_count, rule_count):
+    """Kompilasi `rule_count` aturan dan klasifikasi `address_count` alamat IPv4 dalam satu batch."""
+    rng = random.Random(3)
+    rules = []
+    for n in range(rule_count):
+        action = rng.choice(policy.ACTIONS)
+        base = rng.randrange(2 ** 32)
+        if n % 2:
+            prefix = rng.randrange(16, 33)
+            rules.append({'action': action, 'cidr': f"{policy.ip_address(base)}/{prefix}"})
+        else:
+            end = min(base + rng.randrange(1, 4096), 2 ** 32 - 1)
+            rules.append({'action': action, 'start_ip': str(policy.ip_address(base)),
+                          'end_ip': str(policy.ip_address(end)), 'priority': rng.randrange(50)})
+    values = [rng.randrange(2 ** 32) for _ in range(address_count)]
+    ips = [str(policy.ip_address(value)) for value in values]
+    print(f"{rule_count} rules, {address_count} addresses, numpy: {'yes' if policy.np else 'no'}")
+
+    start = time.perf_counter()
+    engine = policy.PolicyEngine(rules)
+    print(f"compile: {time.perf_counter() - start:.2f}s -> {len(engine.v4[0])} disjoint intervals")
+
+    start = time.perf_counter()
+    actions = engine.classify(ips)
+    elapsed = time.perf_counter() - start
+    matched = sum(action is not None for action in actions)
+    print(f"classify strings: {elapsed:.2f}s ({address_count / elapsed:,.0f} addresses/s, {matched} matched)")
+
+    start = time.perf_counter()
+    engine.lookup_ipv4(values)
+    elapsed = time.perf_counter() - start
+    print(f"lookup integers:  {elapsed:.2f}s ({address_count / elapsed:,.0f} addresses/s)")
+
+
+def bench_history(observation_count, device_count, queries):
+    """Rollup & latensi endpoint riwayat di atas `observation_count` observasi mentah."""
+    conn = sqlite3.connect(backend.DB_NAME)
+    now = int(time.time())
+    # Sampel tiap perangkat tersebar rata selama 30 hari terakhir; ~2% sampel berstatus offline
+    per_device = max(1, observation_count // device_count)
+    step = max(1, 30 * 86400 // per_device)
+    first = now - per_device * step
+
+    def observations():
+        rng = random.Random(11)
+        for n in range(per_device):
+            observed_at = first + n * step
+            for device_id in range(1, device_count + 1):
+                yield device_id, observed_at, device_id, 0 if rng.random() < 0.02 else 1
+
+    start = time.perf_counter()
+    conn.executemany("INSERT INTO device_observations (device_id, observed_at, ip_int, status_code) "
+                     "VALUES (?, ?, ?, ?)", observations())
+    conn.commit()
+    # Perangkat dibuat setelahnya agar observasi tetap berurutan waktu (seperti di produksi)
+    populate(device_count)
+    total = conn.execute("SELECT COUNT(*) FROM device_observations").fetchone()[0]
+    print(f"inserted {total:,} observations in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    # Tanpa jeda antar-batch: yang diukur throughput rollup, bukan jeda untuk penulis lain
+    processed = backend.run_rollups(conn, pause=0)
+    elapsed = time.perf_counter() - start
+    print(f"rollup: {processed:,} observations in {elapsed:.1f}s ({processed / elapsed:,.0f}/s)")
+    for table in ("device_uptime", "fleet_uptime"):
+        print(f"  {table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]:,} rows")
+
+    client = backend.app.test_client()
+    rng = random.Random(5)
+    cases = {
+        "device history (hour, 24h)": lambda: f"/api/devices/{rng.randrange(1, device_count + 1)}/history",
+        "device history (day, 30d)": lambda: f"/api/devices/{rng.randrange(1, device_count + 1)}/history?period=day",
+        "fleet uptime (hour, 24h)": lambda: "/api/stats/uptime",
+        "fleet uptime (day, 30d)": lambda: "/api/stats/uptime?period=day",
+    }
+    print(f"{'case':<28} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for name, make_url in cases.items():
+        timings = []
+        for _ in range(queries):
+            url = make_url()
+            began = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - began) * 1000)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        print(f"{name:<28} {statistics.median(timings):>9.2f} {percentile(timings, 99):>9.2f}")
+
+    start = time.perf_counter()
+    deleted = backend.prune_history(conn, now=now)
+    print(f"prune (>{backend.RETENTION_SECONDS['raw'] // 86400}d raw): {deleted:,} observations "
+          f"in {time.perf_counter() - start:.1f}s")
+    conn.close()
+
+
+def current_rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def write_inventory(path, rows):
+    """Membuat file inventaris CSV atau XLSX (write-only) dengan `rows` baris, ~1% baris tidak valid."""
+    header = ["ip_address", "name", "location", "linked_area", "latitude", "longitude", "status"]
+
+    def generate():
+        rng = random.Random(9)
+        for i in range(rows):
+            ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" if i % 100 else f"bad-{i}"
+            yield [ip, f"Device-{i}", f"Site-{i % 500}", "Internal-LAN",
+                   round(rng.uniform(-11, 6), 6), round(rng.uniform(95, 141), 6), "Allowed"]
+
+    if path.endswith(".csv"):
+        import csv
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(generate())
+    else:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(header)
+        for row in generate():
+            sheet.append(row)
+        workbook.save(path)
+
+
+def bench_import(rows, formats):
+    """Throughput (baris/detik) dan puncak RSS impor inventaris; tiap impor berjalan di proses anak (fork)."""
+    for file_format in formats:
+        path = os.path.join(_tmpdir, f"inventory-{rows}.{file_format}")
+        start = time.perf_counter()
+        write_inventory(path, rows)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"{file_format}: generated {rows:,} rows ({size_mb:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+        job_id = f"bench-{file_format}"
+        conn = sqlite3.connect(backend.DB_NAME)
+        conn.execute("INSERT OR REPLACE INTO import_jobs (id, filename, status) VALUES (?, ?, 'queued')",
+                     (job_id, path))
+        conn.commit()
+        conn.close()
+
+        baseline = current_rss_kb()
+        start = time.perf_counter()
+        backend.db_pool.close_idle()  # Koneksi SQLite tidak boleh terbawa melewati fork
+        pid = os.fork()
+        if pid == 0:
+            backend.run_import_job(job_id, path)
+            os._exit(0)
+        _, _, usage = os.wait4(pid, 0)
+        elapsed = time.perf_counter() - start
+        with backend.app.app_context():
+            job = backend.get_import_job_from_db(job_id)
+        print(f"  {job['status']}: {job['rows_processed']:,} rows in {elapsed:.1f}s "
+              f"({job['rows_processed'] / elapsed:,.0f} rows/s), {job['rows_failed']:,} rejected; "
+              f"peak RSS {usage.ru_maxrss / 1024:.0f} MB (baseline {baseline / 1024:.0f} MB)")
+
+
+def start_server():
+    """Menjalankan server Werkzeug multi-thread di port acak pada thread latar belakang."""
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_server_process():
+    """Menjalankan server di proses anak (fork) agar thread klien load test tidak berebut GIL dengan server."""
+    from werkzeug.serving import make_server
+    backend.db_pool.close_idle()  # Koneksi SQLite tidak boleh terbawa melewati fork
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            logging.getLogger("werkzeug").setLevel(logging.ERROR)
+            server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+            os.write(write_fd, str(server.server_port).encode())
+            os.close(write_fd)
+            server.serve_forever()
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    port = int(os.read(read_fd, 16))
+    os.close(read_fd)
+    return pid, port
+
+
+def open_stream(port):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(b"GET /api/devices/stream HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n")
+    sock.setblocking(False)
+    return sock
+
+
+def bench_stream(clients, idle_seconds, reports):
+    """Load test /api/devices/stream: CPU saat idle dan latensi laporan agen -> event klien."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = clients * 2 + 256  # Server dan klien berjalan dalam proses yang sama
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+    server = start_server()
+    port = server.server_port
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    for _ in range(clients):
+        sock = open_stream(port)
+        selector.register(sock, selectors.EVENT_READ)
+        buffers[sock] = b""
+
+    def read_until(marker, deadline):
+        """Membaca semua socket sampai setiap klien menerima `marker`; mengembalikan waktu terima."""
+        received = {}
+        while len(received) < clients and time.perf_counter() < deadline:
+            for key, _ in selector.select(timeout=0.5):
+                sock = key.fileobj
+                buffers[sock] += sock.recv(65536)
+                if sock not in received and marker in buffers[sock]:
+                    received[sock] = time.perf_counter()
+                    buffers[sock] = buffers[sock].split(marker, 1)[1]
+        return received
+
+    connected = read_until(b"event: hello", time.perf_counter() + 60)
+    print(f"subscribers connected: {len(connected)}/{clients} "
+          f"(broadcaster: {len(backend.broadcaster.subscribers)})")
+
+    # CPU proses selama klien idle (heartbeat tiap SSE_HEARTBEAT_SECONDS)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    samples = []
+    while time.perf_counter() - wall_start < idle_seconds:
+        before = time.process_time()
+        time.sleep(1)
+        samples.append((time.process_time() - before) * 100)
+    cpu_total = time.process_time() - cpu_start
+    print(f"idle {idle_seconds}s: cpu {cpu_total:.3f}s total, per-second % "
+          f"min {min(samples):.1f} / max {max(samples):.1f}")
+
+    latencies = []
+    for n in range(reports):
+        status = "Blocked" if n % 2 == 0 else "Allowed"
+        body = json.dumps(make_devices(256, status=status))
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        sent = time.perf_counter()
+        conn.request("POST", "/api/agent/report", body=body, headers={"Content-Type": "application/json"})
+        conn.getresponse().read()
+        conn.close()
+        received = read_until(b"event: devices", time.perf_counter() + 30)
+        latencies.extend((at - sent) * 1000 for at in received.values())
+
+    latencies.sort()
+    if latencies:
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"report -> event latency over {len(latencies)} deliveries: "
+              f"p50 {statistics.median(latencies):.1f} ms, p99 {p99:.1f} ms, max {latencies[-1]:.1f} ms")
+
+    for sock in buffers:
+        sock.close()
+    server.shutdown()
+
+
+def bench_load(device_count, writers, readers, duration, report_size, seed):
+    """Load test campuran lewat HTTP: agen menulis laporan delta sambil dashboard membaca.
+
+    Setiap thread memakai seed tetap sehingga urutan request dapat diulang; hasil per jenis request
+    dibandingkan dengan /api/metrics (waktu SQL, lock wait, pool koneksi) dari server yang sama.
+    """
+    start = time.perf_counter()
+    populate(device_count)
+    print(f"populated {device_count:,} devices in {time.perf_counter() - start:.1f}s "
+          f"(journal_mode {backend.db_pool.journal_mode})")
+
+    pid, port = start_server_process()
+    timings, errors = {}, {}
+    lock = threading.Lock()
+    statuses = ["Allowed"] * 8 + ["Blocked", "Maintenance"]
+    share = max(report_size, device_count // max(1, writers))
+
+    def ip(n):
+        return f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"
+
+    def timed(conn, name, method, path, body=None, headers=None):
+        began = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()  # http.client membuka ulang koneksi pada request berikutnya
+            response, data = None, b""
+        elapsed = (time.perf_counter() - began) * 1000
+        with lock:
+            timings.setdefault(name, []).append(elapsed)
+            if response is None or response.status >= 500:
+                errors[name] = errors.get(name, 0) + 1
+        return response, data
+
+    def writer(n, deadline):
+        rng = random.Random(seed + n)
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        base = n * share % max(1, device_count)
+        while time.perf_counter() < deadline:
+            # Setiap agen melaporkan bagian IP-nya sendiri per shard /24, seperti agen sungguhan
+            offset = base + rng.randrange(max(1, share // 256)) * 256
+            devices = make_devices(report_size, offset=offset)
+            for device in devices:
+                device['status'] = rng.choice(statuses)
+            report = {"format": "delta", "agent_id": f"load-agent-{n}", "shard": f"{ip(offset)}/24",
+                      "upserts": devices}
+            body = gzip.compress(json.dumps(report).encode())
+            timed(conn, "agent report (delta)", "POST", "/api/agent/report", body,
+                  {"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        conn.close()
+
+    def reader(n, deadline):
+        rng = random.Random(seed + 1000 + n)
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        version, etag = None, None
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            if roll < 0.6 and version is not None:
+                # Polling dashboard: ?since= + If-None-Match seperti frontend
+                response, data = timed(conn, "dashboard poll (since)", "GET", f"/api/devices?since={version}",
+                                       headers={"If-None-Match": etag} if etag else None)
+                if response is not None and response.status == 200:
+                    version, etag = json.loads(data)["version"], response.getheader("ETag")
+            elif roll < 0.8 or version is None:
+                response, data = timed(conn, "page (limit=50)", "GET", "/api/devices?limit=50")
+                if response is not None and response.status == 200:
+                    version = json.loads(data)["version"]
+            elif roll < 0.95:
+                query = f"{ip(rng.randrange(device_count))}/24" if rng.random() < 0.5 else "jakarta&limit=50"
+                timed(conn, "search", "GET", f"/api/devices?q={query}")
+            else:
+                timed(conn, "fleet uptime", "GET", "/api/stats/uptime")
+        conn.close()
+
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=writer, args=(n, deadline)) for n in range(writers)]
+    threads += [threading.Thread(target=reader, args=(n, deadline)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{writers} writers, {readers} readers, {duration}s")
+    print(f"{'request':<24} {'count':>7} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'errors':>7}")
+    for name, values in sorted(timings.items()):
+        print(f"{name:<24} {len(values):>7} {len(values) / duration:>8.1f} {statistics.median(values):>9.2f} "
+              f"{percentile(values, 99):>9.2f} {errors.get(name, 0):>7}")
+
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("GET", "/api/metrics")
+    snapshot = json.loads(conn.getresponse().read())
+    conn.close()
+    print(f"{'server route':<40} {'p99 (ms)':>9} {'sql avg (ms)':>13} {'rows/req':>9}")
+    for route, route_metrics in snapshot["routes"].items():
+        requests_count = route_metrics["requests"]
+        print(f"{route:<40} {route_metrics['latency']['p99_ms']:>9} {route_metrics['sql']['avg_ms']:>13} "
+              f"{route_metrics['rows_serialized'] / requests_count:>9.1f}")
+    lock_wait = snapshot["lock_wait"]
+    print(f"lock wait: {lock_wait['count']} writes, p50 {lock_wait['p50_ms']} ms, p99 {lock_wait['p99_ms']} ms, "
+          f"max {lock_wait['max_ms']} ms, timeouts {lock_wait['timeouts']}")
+    print(f"db pool: {snapshot['db_pool']}")
+    os.kill(pid, signal.SIGTERM)
+    os.waitpid(pid, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    report = sub.add_parser("report", help="throughput /api/agent/report")
+    report.add_argument("--sizes", type=int, nargs="+", default=[256, 4096, 65536])
+    report.add_argument("--repeat", type=int, default=5)
+
+    stream = sub.add_parser("stream", help="load test /api/devices/stream (SSE)")
+    stream.add_argument("--clients", type=int, default=1000)
+    stream.add_argument("--idle-seconds", type=int, default=10)
+    stream.add_argument("--reports", type=int, default=5)
+
+    search = sub.add_parser("search", help="latensi pencarian & paginasi /api/devices")
+    search.add_argument("--devices", type=int, default=1_000_000)
+    search.add_argument("--queries", type=int, default=200)
+
+    scan = sub.add_parser("scan", help="throughput agent.scan_networks dengan scanner palsu")
+    scan.add_argument("--cidrs", nargs="+", default=["10.0.0.0/16", "10.1.0.0/16"])
+    scan.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    scan.add_argument("--latency", type=float, default=0.02, help="detik per shard")
+    scan.add_argument("--alive-ratio", type=float, default=0.05)
+
+    policy_parser = sub.add_parser("policy", help="klasifikasi IP terhadap banyak aturan kebijakan")
+    policy_parser.add_argument("--addresses", type=int, default=1_000_000)
+    policy_parser.add_argument("--rules", type=int, default=100_000)
+
+    history = sub.add_parser("history", help="rollup & query riwayat status perangkat")
+    history.add_argument("--observations", type=int, default=10_000_000)
+    history.add_argument("--devices", type=int, default=100_000)
+    history.add_argument("--queries", type=int, default=200)
+
+    import_parser = sub.add_parser("import", help="impor inventaris CSV/XLSX: baris/detik & puncak RSS")
+    import_parser.add_argument("--rows", type=int, default=500_000)
+    import_parser.add_argument("--formats", nargs="+", default=["csv", "xlsx"], choices=["csv", "xlsx"])
+
+    load = sub.add_parser("load", help="load test campuran: laporan agen + baca dashboard lewat HTTP")
+    load.add_argument("--devices", type=int, default=50_000)
+    load.add_argument("--writers", type=int, default=4)
+    load.add_argument("--readers", type=int, default=16)
+    load.add_argument("--duration", type=int, default=20, help="detik")
+    load.add_argument("--report-size", type=int, default=256, help="perangkat per laporan agen")
+    load.add_argument("--seed", type=int, default=1)
+    load.add_argument("--journal-mode", default="WAL", choices=["WAL", "DELETE"])
+
+    args = parser.parse_args()
+    if args.command == "load":
+        backend.db_pool.journal_mode = args.journal_mode
+    backend.init_db()
+    if args.command == "report":
+        bench_report(args.sizes, args.repeat)
+    elif args.command == "stream":
+        bench_stream(args.clients, args.idle_seconds, args.reports)
+    elif args.command == "search":
+        bench_search(args.devices, args.queries)
+    elif args.command == "scan":
+        bench_scan(args.cidrs, args.concurrency, args.latency, args.alive_ratio)
+    elif args.command == "policy":
+        bench_policy(args.addresses, args.rules)
+    elif args.command == "history":
+        bench_history(args.observations, args.devices, args.queries)
+    elif args.command == "import":
+        bench_import(args.rows, args.formats)
+    elif args.command == "load":
+        bench_load(args.devices, args.writers, args.readers, args.duration, args.report_size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
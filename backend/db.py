@@ -0,0 +1,162 @@
+"""Koneksi SQLite untuk backend: pool koneksi, pragma, dan pengukuran waktu SQL per thread.
+
+Koneksi dibuka sekali (mode WAL dan pragma yang disetel) lalu dipakai ulang antar-request,
+sehingga cache prepared statement (cached_statements) dan cache halaman SQLite tetap hangat.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+BUSY_TIMEOUT_SECONDS = 5.0  # Menunggu kunci tulis sebelum "database is locked"
+CACHED_STATEMENTS = 256  # Prepared statement yang di-cache per koneksi (default sqlite3: 128)
+PRAGMAS = (
+    "PRAGMA cache_size = -32000",  # ~32 MB cache halaman per koneksi
+    "PRAGMA temp_store = MEMORY",  # Tabel sementara (report_batch, rollup_batch) di memori
+    "PRAGMA mmap_size = 268435456",  # Baca lewat mmap hingga 256 MB
+)
+
+_query_stats = threading.local()
+
+
+def reset_query_stats():
+    """Mengosongkan statistik SQL thread ini (dipanggil di awal setiap request)."""
+    _query_stats.seconds = 0.0
+    _query_stats.queries = 0
+
+
+def get_query_stats():
+    """Mengembalikan (detik, jumlah_query) SQL yang dijalankan thread ini sejak reset terakhir."""
+    return getattr(_query_stats, 'seconds', 0.0), getattr(_query_stats, 'queries', 0)
+
+
+def _record_query(started, queries=1):
+    _query_stats.seconds = getattr(_query_stats, 'seconds', 0.0) + time.perf_counter() - started
+    _query_stats.queries = getattr(_query_stats, 'queries', 0) + queries
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor yang menjumlahkan waktu execute/fetchall ke statistik thread."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(started)
+
+    def fetchall(self):
+        # Untuk SELECT besar sebagian besar waktu habis saat mengambil baris, bukan di execute()
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_query(started, queries=0)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute bawaan memanggil execute() versi C, jadi diarahkan lewat TimedCursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(path, journal_mode=JOURNAL_MODE):
+    """Membuka koneksi dengan pragma performa; boleh dipindah antar-thread (pool)."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, factory=TimedConnection,
+                           cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+    mode = conn.execute(f"PRAGMA journal_mode = {journal_mode}").fetchone()[0]
+    if mode == 'wal':
+        # Dengan WAL, synchronous=NORMAL tetap aman dari korupsi; hanya checkpoint yang fsync
+        conn.execute("PRAGMA synchronous = NORMAL")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Pool koneksi SQLite sederhana.
+
+    Jika pool kosong dibuka koneksi baru (SQLite tidak membatasi pembaca dengan WAL); saat dikembalikan,
+    koneksi disimpan hingga `size` koneksi idle dan sisanya ditutup.
+    """
+
+    def __init__(self, path, size=8, journal_mode=JOURNAL_MODE):
+        self.path = path
+        self.size = size
+        self.journal_mode = journal_mode
+        # LIFO: koneksi yang terakhir dipakai punya cache paling hangat
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.in_use = 0
+
+    def acquire(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.path, self.journal_mode)
+            with self.lock:
+                self.created += 1
+        with self.lock:
+            self.in_use += 1
+        return conn
+
+    def release(self, conn):
+        # Transaksi yang tertinggal (mis. karena error) tidak boleh terbawa ke pemakai berikutnya
+        if conn.in_transaction:
+            conn.rollback()
+        with self.lock:
+            self.in_use -= 1
+        if self.idle.qsize() < self.size:
+            self.idle.put(conn)
+        else:
+            conn.close()
+            with self.lock:
+                self.closed += 1
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_idle(self):
+        """Menutup semua koneksi idle (mis. sebelum fork atau saat benchmark selesai)."""
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+            with self.lock:
+                self.closed += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "idle": self.idle.qsize(),
+                "in_use": self.in_use,
+                "created": self.created,
+                "closed": self.closed,
+                "journal_mode": self.journal_mode,
+            }
@@ -0,0 +1,114 @@
+"""Membaca file inventaris (Excel/CSV) baris demi baris dan menormalkan setiap baris perangkat.
+
+File tidak pernah dimuat utuh ke memori: Excel dibaca dengan openpyxl mode read-only dan CSV
+dengan csv.reader, keduanya sebagai generator.
+"""
+import csv
+import os
+from ipaddress import ip_address
+
+EXCEL_EXTENSIONS = {'.xlsx', '.xlsm'}
+CSV_EXTENSIONS = {'.csv'}
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS | CSV_EXTENSIONS
+
+# Nama kolom yang diterima -> nama kolom di tabel devices
+HEADER_ALIASES = {
+    'ip_address': 'ip_address', 'ip': 'ip_address', 'ip_addr': 'ip_address', 'alamat_ip': 'ip_address',
+    'name': 'name', 'nama': 'name', 'device': 'name', 'device_name': 'name', 'nama_device': 'name',
+    'location': 'location', 'lokasi': 'location',
+    'status': 'status',
+    'linked_area': 'linked_area', 'area': 'linked_area',
+    'latitude': 'latitude', 'lat': 'latitude',
+    'longitude': 'longitude', 'long': 'longitude', 'lng': 'longitude', 'lon': 'longitude',
+}
+VALID_STATUSES = {'allowed': 'Allowed', 'blocked': 'Blocked', 'maintenance': 'Maintenance'}
+
+
+def normalize_header(value):
+    key = str(value or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return HEADER_ALIASES.get(key)
+
+
+def iter_rows(path):
+    """Generator (nomor_baris, {kolom: nilai}) untuk setiap baris data; baris 1 adalah header."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in EXCEL_EXTENSIONS:
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from _iter_table(workbook.active.iter_rows(values_only=True))
+        finally:
+            workbook.close()
+    elif extension in CSV_EXTENSIONS:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from _iter_table(csv.reader(f))
+    else:
+        raise ValueError(f"Unsupported file type: {extension}")
+
+
+def _iter_table(rows):
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [normalize_header(value) for value in header]
+    if 'ip_address' not in columns:
+        raise ValueError("The file must have an 'ip_address' (or 'ip') column")
+    for row_number, values in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in values):
+            continue  # Baris kosong
+        yield row_number, {column: value for column, value in zip(columns, values) if column}
+
+
+def count_rows(path):
+    """Perkiraan jumlah baris data untuk progres; None jika tidak bisa diketahui tanpa membaca isi."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in EXCEL_EXTENSIONS:
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max_row - 1 if max_row else None
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return max(sum(1 for row in csv.reader(f) if any(row)) - 1, 0)
+
+
+def _parse_coordinate(value, name, limit):
+    if value in (None, ''):
+        return None
+    try:
+        number = float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"{name} is not a number: {value!r}")
+    if not -limit <= number <= limit:
+        raise ValueError(f"{name} out of range (-{limit}..{limit}): {number}")
+    return number
+
+
+def normalize_row(raw):
+    """Memvalidasi dan menormalkan satu baris; mengembalikan dict perangkat atau melempar ValueError."""
+    value = raw.get('ip_address')
+    if value in (None, ''):
+        raise ValueError("ip_address is required")
+    try:
+        ip = str(ip_address(str(value).strip()))
+    except ValueError:
+        raise ValueError(f"Invalid ip_address: {value!r}")
+
+    device = {'ip_address': ip}
+    for column in ('name', 'location', 'linked_area'):
+        text = str(raw.get(column) or '').strip()
+        if text:
+            device[column] = text
+
+    status = str(raw.get('status') or '').strip()
+    if status:
+        if status.lower() not in VALID_STATUSES:
+            raise ValueError(f"Invalid status: {status!r}")
+        device['status'] = VALID_STATUSES[status.lower()]
+
+    device['latitude'] = _parse_coordinate(raw.get('latitude'), 'latitude', 90)
+    device['longitude'] = _parse_coordinate(raw.get('longitude'), 'longitude', 180)
+    return device
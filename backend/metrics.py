@@ -0,0 +1,113 @@
+"""Metrik request di dalam proses untuk /api/metrics.
+
+Per route: histogram latensi, waktu SQL, jumlah query dan baris yang diserialisasi.
+Global: waktu tunggu kunci tulis SQLite (BEGIN IMMEDIATE) dan jumlah timeout-nya.
+Semua nilai dihitung sejak proses dimulai; tidak ada dependensi eksternal.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# Batas atas bucket histogram dalam milidetik
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Histogram bucket tetap; kuantil diperkirakan dengan interpolasi linear di dalam bucket."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for n, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[n - 1] if n else 0
+                upper = self.bounds[n] if n < len(self.bounds) else self.max
+                return round(min(lower + (upper - lower) * (rank - seen) / count, self.max), 3)
+            seen += count
+        return round(self.max, 3)
+
+    def snapshot(self):
+        # Kumulatif seperti histogram Prometheus: jumlah observasi <= le
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total, 3),
+            "avg_ms": round(self.total / self.count, 3) if self.count else None,
+            "max_ms": round(self.max, 3),
+            "p50_ms": self.quantile(0.5),
+            "p90_ms": self.quantile(0.9),
+            "p99_ms": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.sql = Histogram()
+        self.sql_queries = 0
+        self.rows_serialized = 0
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency": self.latency.snapshot(),
+            "sql": self.sql.snapshot(),
+            "sql_queries": self.sql_queries,
+            "rows_serialized": self.rows_serialized,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.routes = {}
+        self.lock_wait = Histogram()
+        self.lock_timeouts = 0
+
+    def observe_request(self, route, status_code, seconds, sql_seconds, sql_queries, rows_serialized):
+        with self.lock:
+            metrics = self.routes.get(route)
+            if metrics is None:
+                metrics = self.routes[route] = RouteMetrics()
+            metrics.requests += 1
+            metrics.errors += status_code >= 500
+            metrics.latency.observe(seconds * 1000)
+            metrics.sql.observe(sql_seconds * 1000)
+            metrics.sql_queries += sql_queries
+            metrics.rows_serialized += rows_serialized
+
+    def observe_lock_wait(self, seconds, timed_out=False):
+        with self.lock:
+            self.lock_wait.observe(seconds * 1000)
+            self.lock_timeouts += timed_out
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "routes": {route: metrics.snapshot() for route, metrics in sorted(self.routes.items())},
+                "lock_wait": {**self.lock_wait.snapshot(), "timeouts": self.lock_timeouts},
+            }
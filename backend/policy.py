@@ -0,0 +1,183 @@
+"""Mesin kebijakan IP (allow/block/maintenance) yang dipakai bersama oleh agent.py dan app.py.
+
+Aturan berupa CIDR atau rentang start_ip-end_ip (IPv4 maupun IPv6). Aturan dikompilasi sekali
+menjadi array interval yang terurut dan tidak saling tumpang tindih, lalu satu batch IP
+diklasifikasikan dengan binary search (numpy.searchsorted jika numpy tersedia, untuk kedua versi IP).
+"""
+import heapq
+import socket
+from bisect import bisect_right
+from ipaddress import ip_address, ip_network
+
+try:
+    import numpy as np
+except ImportError:  # numpy opsional; tanpa numpy dipakai bisect per IP
+    np = None
+
+# Aksi kebijakan -> status perangkat
+ACTION_STATUS = {
+    'allow': 'Allowed',
+    'block': 'Blocked',
+    'maintenance': 'Maintenance',
+}
+ACTIONS = tuple(ACTION_STATUS)
+
+# Prioritas default jika aturan tidak menyebutkan: block menang atas maintenance, maintenance atas allow
+DEFAULT_PRIORITY = {'allow': 10, 'maintenance': 20, 'block': 30}
+
+
+def parse_rule(rule):
+    """Memvalidasi satu aturan dan mengembalikan (versi_ip, start, end, priority, action).
+
+    Aturan berupa dict dengan 'action' dan salah satu dari 'cidr' atau 'start_ip' + 'end_ip',
+    serta 'priority' opsional. Melempar ValueError jika aturan tidak valid.
+    """
+    action = str(rule.get('action', '')).lower()
+    if action not in ACTION_STATUS:
+        raise ValueError(f"Unknown policy action: {rule.get('action')!r}")
+
+    if rule.get('cidr'):
+        network = ip_network(str(rule['cidr']).strip(), strict=False)
+        version, start, end = network.version, int(network.network_address), int(network.broadcast_address)
+    elif rule.get('start_ip') and rule.get('end_ip'):
+        first, last = ip_address(str(rule['start_ip']).strip()), ip_address(str(rule['end_ip']).strip())
+        if first.version != last.version:
+            raise ValueError("start_ip and end_ip must be the same IP version")
+        version, start, end = first.version, int(first), int(last)
+        if start > end:
+            raise ValueError("start_ip must not be greater than end_ip")
+    else:
+        raise ValueError("A policy rule needs 'cidr' or 'start_ip' and 'end_ip'")
+
+    priority = rule.get('priority')
+    priority = DEFAULT_PRIORITY[action] if priority is None else int(priority)
+    return version, start, end, priority, action
+
+
+def parse_ip(ip):
+    """Mengubah string IP menjadi (versi, integer); (None, None) jika tidak valid."""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except (OSError, TypeError):
+        pass
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except (OSError, TypeError):
+        return None, None
+
+
+def compile_intervals(rules):
+    """Menggabungkan aturan yang tumpang tindih menjadi interval disjoint (start, end, action_index).
+
+    `rules` berisi (start, end, priority, order, action_index). Prioritas tertinggi menang;
+    jika sama, aturan yang belakangan (order lebih besar) menang. Sweep line dengan heap, O(n log n).
+    """
+    rules = sorted(rules)
+    boundaries = sorted({rule[0] for rule in rules} | {rule[1] + 1 for rule in rules})
+    starts, ends, actions = [], [], []
+    active = []
+    i = 0
+    for k, boundary in enumerate(boundaries[:-1]):
+        while i < len(rules) and rules[i][0] <= boundary:
+            start, end, priority, order, action = rules[i]
+            heapq.heappush(active, (-priority, -order, end, action))
+            i += 1
+        # Buang aturan yang sudah berakhir (lazy deletion)
+        while active and active[0][2] < boundary:
+            heapq.heappop(active)
+        if not active:
+            continue
+        action = active[0][3]
+        segment_end = boundaries[k + 1] - 1
+        if actions and actions[-1] == action and ends[-1] + 1 == boundary:
+            ends[-1] = segment_end
+        else:
+            starts.append(boundary)
+            ends.append(segment_end)
+            actions.append(action)
+    return starts, ends, actions
+
+
+def _ipv4_array(values):
+    return np.asarray(values, dtype=np.uint64)
+
+
+def _ipv6_array(values):
+    # 128 bit tidak muat di integer numpy: disimpan sebagai 16 byte big-endian ('S16'), yang urutan
+    # perbandingannya sama dengan urutan numerik sehingga searchsorted dan <= tetap berlaku
+    return np.array([value.to_bytes(16, 'big') for value in values], dtype='S16')
+
+
+class PolicyEngine:
+    """Aturan yang sudah dikompilasi; buat sekali lalu pakai untuk banyak batch."""
+
+    def __init__(self, rules=()):
+        compiled = {4: [], 6: []}
+        for order, rule in enumerate(rules):
+            version, start, end, priority, action = parse_rule(rule)
+            compiled[version].append((start, end, priority, order, ACTIONS.index(action)))
+
+        self.rule_count = len(compiled[4]) + len(compiled[6])
+        self.v4 = compile_intervals(compiled[4])
+        self.v6 = compile_intervals(compiled[6])
+        if np is not None:
+            self.v4_arrays = self.to_arrays(self.v4, _ipv4_array)
+            self.v6_arrays = self.to_arrays(self.v6, _ipv6_array)
+
+    @staticmethod
+    def to_arrays(table, encode):
+        starts, ends, actions = table
+        return encode(starts), encode(ends), np.array(actions, dtype=np.int8)
+
+    def classify(self, ips):
+        """Mengembalikan aksi ('allow'/'block'/'maintenance') atau None untuk setiap IP pada batch."""
+        results = [None] * len(ips)
+        v4_positions, v4_values, v6_positions, v6_values = [], [], [], []
+        for n, ip in enumerate(ips):
+            version, value = parse_ip(ip)
+            if version == 4:
+                v4_positions.append(n)
+                v4_values.append(value)
+            elif version == 6:
+                v6_positions.append(n)
+                v6_values.append(value)
+
+        for n, action in zip(v4_positions, self.lookup_ipv4(v4_values)):
+            results[n] = action
+        for n, action in zip(v6_positions, self.lookup_ipv6(v6_values)):
+            results[n] = action
+        return results
+
+    def classify_statuses(self, ips):
+        """Seperti classify(), tetapi mengembalikan status perangkat ('Allowed', 'Blocked', ...)."""
+        return [ACTION_STATUS[action] if action else None for action in self.classify(ips)]
+
+    def lookup_ipv4(self, values):
+        """Klasifikasi integer IPv4 dalam satu operasi numpy (fallback ke bisect tanpa numpy)."""
+        if np is None or not values or not self.v4[0]:
+            return self.lookup(self.v4, values)
+        return self.lookup_arrays(self.v4_arrays, _ipv4_array(values))
+
+    def lookup_ipv6(self, values):
+        """Klasifikasi integer IPv6 dalam satu operasi numpy (fallback ke bisect tanpa numpy)."""
+        if np is None or not values or not self.v6[0]:
+            return self.lookup(self.v6, values)
+        return self.lookup_arrays(self.v6_arrays, _ipv6_array(values))
+
+    @staticmethod
+    def lookup_arrays(arrays, values):
+        starts, ends, actions = arrays
+        positions = np.searchsorted(starts, values, side='right') - 1
+        safe = np.maximum(positions, 0)
+        hit = (positions >= 0) & (values <= ends[safe])
+        codes = np.where(hit, actions[safe], -1)
+        return [ACTIONS[code] if code >= 0 else None for code in codes.tolist()]
+
+    @staticmethod
+    def lookup(table, values):
+        starts, ends, actions = table
+        results = []
+        for value in values:
+            position = bisect_right(starts, value) - 1
+            results.append(ACTIONS[actions[position]] if position >= 0 and value <= ends[position] else None)
+        return results
@@ -0,0 +1,9 @@
+"""Format laporan delta agen yang dipakai bersama oleh agent.py dan app.py."""
+import hashlib
+
+DELTA_FORMAT = "delta"
+
+
+def host_checksum(ips):
+    """Checksum himpunan IP satu shard; agen mengirimnya, server membandingkan dengan agent_hosts."""
+    return hashlib.sha1("\n".join(sorted(ips)).encode()).hexdigest()
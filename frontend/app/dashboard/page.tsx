@@ -38,12 +38,34 @@ export default function Dashboard() {
   const router = useRouter()
   const fileInputRef = useRef<HTMLInputElement>(null);
 
+  // Versi & ETag terakhir dari server untuk sinkronisasi delta
+  const syncVersionRef = useRef<number | null>(null);
+  const etagRef = useRef<string | null>(null);
+
   const fetchDevices = async () => {
     try {
       const apiUrl = process.env.NEXT_PUBLIC_API_URL || "https://device-management-project.vercel.app";
-      const response = await fetch(`${apiUrl}/api/devices`);
+      const since = syncVersionRef.current;
+      const url = since === null ? `${apiUrl}/api/devices` : `${apiUrl}/api/devices?since=${since}`;
+      const headers: HeadersInit = etagRef.current ? { "If-None-Match": etagRef.current } : {};
+      const response = await fetch(url, { headers, cache: "no-store" });
+      if (response.status === 304) return; // Tidak ada perubahan
+
       const data = await response.json();
-      setDevices(data.devices || []);
+      etagRef.current = response.headers.get("ETag");
+      if (since === null) {
+        setDevices(data.devices || []);
+      } else {
+        const changed: Device[] = data.devices || [];
+        const deleted = new Set<number>(data.deleted || []);
+        setDevices((current) => {
+          const byId = new Map(current.map((device) => [device.id, device]));
+          deleted.forEach((id) => byId.delete(id));
+          changed.forEach((device) => byId.set(device.id, device));
+          return Array.from(byId.values()).sort((a, b) => b.id - a.id);
+        });
+      }
+      syncVersionRef.current = data.version ?? null;
     } catch (error) {
       console.error("Error fetching devices:", error);
     } finally {